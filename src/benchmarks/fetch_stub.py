@@ -0,0 +1,126 @@
+"""Checks fetch_engine against a local stub endpoint, without network access.
+
+    python src/benchmarks/fetch_stub.py [--rate 20] [--keys 40]
+
+The stub serves GET /<key> on 127.0.0.1 and answers the first --fail
+requests for every key with a 503, like stats.nba.com timing out. The
+check fails (exit status 1) unless every key comes back after exactly
+--fail retries, the requests never beat the token bucket, and stopping
+the consumer early leaves no more than the bounded queue of calls behind.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from fetch import fetch_engine
+from metrics import METRICS
+
+
+class stub_endpoint:
+    """Threaded HTTP server that fails the first `fail` requests of each key"""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.times = []
+        endpoint = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                key = self.path.strip('/')
+                with endpoint.lock:
+                    endpoint.times.append(time.monotonic())
+                    endpoint.hits[key] = endpoint.hits.get(key, 0) + 1
+                    failing = endpoint.hits[key] <= endpoint.fail
+                if failing:
+                    self.send_error(503)
+                    return
+                data = json.dumps({'key': key}).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def get(self, key):
+        with urllib.request.urlopen(self.url + key, timeout=5) as response:
+            return json.load(response)['key']
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def check(rate, burst, n_keys, fail, workers):
+    """Runs the engine against the stub and returns the problems found"""
+    problems = []
+    stub = stub_endpoint(fail)
+    engine = fetch_engine(max_workers=workers, rate=rate, burst=burst, retries=fail + 1, backoff=0.01)
+    try:
+        keys = [str(i) for i in range(n_keys)]
+        start = time.monotonic()
+        results = {key: (result, error) for key, result, error in engine.map(stub.get, keys)}
+        seconds = time.monotonic() - start
+
+        errors = [key for key, (result, error) in results.items() if error is not None or result != key]
+        if len(results) != n_keys or errors:
+            problems.append('{} of {} keys missing or failed: {}'.format(n_keys - len(results) + len(errors),
+                                                                         n_keys, errors[:5]))
+        retries = METRICS.counters.get('fetch.get.retries', 0)
+        if retries != n_keys * fail:
+            problems.append('{} retries, expected {}'.format(retries, n_keys * fail))
+
+        # The bucket allows `burst` requests at once and `rate` per second after that
+        requests = len(stub.times)
+        if seconds < (requests - burst) / rate * 0.95:
+            problems.append('{} requests in {:.2f}s, faster than {}/s'.format(requests, seconds, rate))
+        for i in range(len(stub.times)):
+            span = stub.times[i] - stub.times[0]
+            if i + 1 > burst + span * rate * 1.05 + 1:
+                problems.append('request {} came {:.3f}s after the first, over the rate'.format(i + 1, span))
+                break
+
+        # Stopping after 3 results must not run the rest of the keys
+        stub.hits.clear()
+        for n, _ in enumerate(engine.map(stub.get, ['early' + key for key in keys]), 1):
+            if n == 3:
+                break
+        calls = sum(stub.hits.values())
+        limit = (3 + workers * 2) * (fail + 1)
+        if calls > limit:
+            problems.append('{} calls ran after stopping at 3 keys, expected at most {}'.format(calls, limit))
+
+        print(json.dumps({'keys': n_keys, 'requests': requests, 'seconds': seconds, 'retries': retries,
+                          'calls_after_early_stop': calls}, indent=1))
+    finally:
+        stub.close()
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='fetch_engine retries and rate limit against a local stub')
+    parser.add_argument('--rate', type=float, default=20.0)
+    parser.add_argument('--burst', type=int, default=2)
+    parser.add_argument('--keys', type=int, default=40)
+    parser.add_argument('--fail', type=int, default=1, help='failed requests per key before it succeeds')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    problems = check(args.rate, args.burst, args.keys, args.fail, args.workers)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
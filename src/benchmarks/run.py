@@ -0,0 +1,174 @@
+"""Times the data pipeline on a synthetic database, without network access.
+
+    python src/benchmarks/run.py --seasons 10 [--out results.json] [--baseline baseline.json]
+
+Each stage runs in its own process and reports the best of --repeat runs.
+Whatever a stage needs (the loaded or cleaned team data) is prepared before
+the clock starts. One more, untimed, run under tracemalloc gives the
+stage's own peak memory (traced_peak_mb), which the setup doesn't count
+towards. With --baseline, stages that got more than --tolerance slower, or
+whose traced peak grew by more than that, are reported and the exit status
+is 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from metrics import peak_rss_mb
+from synthetic_db import make_database
+
+
+def _team_data(db_path, seasons, steps):
+    """transform object and the team data after running `steps` of load -> clean -> convert_pcts"""
+    import sqlite3
+    from transform_db import transform
+
+    obj = transform(conn=sqlite3.connect(db_path), start_season=seasons[0], end_season=seasons[1])
+    data = obj.load_team_data() if steps > 0 else None
+    if steps > 1:
+        data = obj.clean_team_data(data)
+    if steps > 2:
+        data = obj.convert_pcts(data.dropna(subset='PCT_PTS_2PT'))
+    return obj, data
+
+
+def _stage(name, db_path, seasons):
+    """Prepares a stage's input and returns the timed call, which returns the rows it produced"""
+    if name == 'load_team_data':
+        obj, _ = _team_data(db_path, seasons, 0)
+        return lambda: len(obj.load_team_data())
+    if name == 'clean_team_data':
+        obj, data = _team_data(db_path, seasons, 1)
+        return lambda: len(obj.clean_team_data(data))
+    if name == 'convert_pcts':
+        obj, data = _team_data(db_path, seasons, 2)
+        data = data.dropna(subset='PCT_PTS_2PT')
+        return lambda: len(obj.convert_pcts(data))
+    if name == 'create_matchups':
+        obj, data = _team_data(db_path, seasons, 3)
+        return lambda: len(obj.create_matchups(data))
+    if name == 'make_windows':
+        from windows import make_windows
+        _, data = _team_data(db_path, seasons, 3)
+        data['TEAM_ABBREVIATION'] = data['TEAM_ABBREVIATION'].cat.codes
+        return lambda: len(make_windows(data, 10)[0])
+
+    from transform_db import load_clean
+    loader = load_clean(db_path)
+    return lambda: len(getattr(loader, name)())
+
+
+STAGES = ['load_team_data', 'clean_team_data', 'convert_pcts', 'create_matchups', 'make_windows',
+          'basic_boxscores', 'advanced_boxscores', 'scoring_boxscores', 'boxscore_matchups',
+          'players', 'agg_boxscores_raw']
+
+
+def _run_stage(name, db_path, seasons, repeat, queue):
+    try:
+        timed = _stage(name, db_path, seasons)
+        rss_before = peak_rss_mb()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = timed()
+            times.append(time.perf_counter() - start)
+        seconds = min(times)
+
+        # Only what is allocated after start() is traced, so the peak is the stage's own
+        tracemalloc.start()
+        timed()
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+        queue.put({'seconds': seconds, 'rows': rows, 'rows_per_s': rows / seconds if seconds else None,
+                   'traced_peak_mb': traced_peak, 'peak_rss_mb': peak_rss_mb(), 'setup_peak_rss_mb': rss_before})
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def run_stage(name, db_path, seasons, repeat=3):
+    """Best of `repeat` runs of a stage in a fresh process"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_stage, args=(name, db_path, seasons, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def build_boxscore_table(db_path, seasons):
+    """The boxscore matchup table boxscore_matchups reads, built like add_boxscores_db does"""
+    from db_writer import batch_writer
+    from schema import create_table
+
+    obj, data = _team_data(db_path, seasons, 3)
+    conn = obj.conn
+    create_table(conn, 'boxscore')
+    with batch_writer(conn) as writer:
+        writer.add('boxscore', obj.create_matchups(data))
+    conn.close()
+
+
+def compare(results, baseline, tolerance):
+    """Stages whose time or traced peak memory grew by more than tolerance over the baseline"""
+    regressions = {}
+    for name, result in results['stages'].items():
+        before = baseline.get('stages', {}).get(name, {})
+        for key, label in (('seconds', 'baseline_s'), ('traced_peak_mb', 'baseline_mb')):
+            if before.get(key) and key in result and result[key] > before[key] * (1 + tolerance):
+                regressions.setdefault(name, {}).update({label: before[key], key: result[key],
+                                                         key + '_change': result[key] / before[key] - 1})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline benchmarks on a synthetic database')
+    parser.add_argument('--seasons', type=int, default=5, choices=range(1, 51), metavar='1-50')
+    parser.add_argument('--players-per-team', type=int, default=13)
+    parser.add_argument('--stages', nargs='*', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=3, help='report the best of this many runs')
+    parser.add_argument('--db', help='reuse (or keep) the synthetic database at this path')
+    parser.add_argument('--out')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    first_season = 2013
+    seasons = (first_season, first_season + args.seasons - 1)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'synthetic.db')
+
+    start = time.perf_counter()
+    if not os.path.exists(db_path):
+        counts = make_database(db_path, args.seasons, first_season, players_per_team=args.players_per_team)
+        build_boxscore_table(db_path, seasons)
+    else:
+        counts = None
+    results = {'seasons': args.seasons, 'rows': counts, 'generate_s': time.perf_counter() - start,
+               'python': sys.version.split()[0], 'stages': {}}
+
+    for name in args.stages:
+        results['stages'][name] = run_stage(name, db_path, seasons, args.repeat)
+        print(name, json.dumps(results['stages'][name]), file=sys.stderr)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['regressions'] = compare(results, json.load(f), args.tolerance)
+        status = 1 if results['regressions'] else 0
+
+    print(json.dumps(results, indent=1))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Import time of each entry point, measured in a fresh interpreter.
+
+    python src/benchmarks/startup.py [--repeat 5] [--out startup.json]
+
+Prints (and optionally writes) JSON with the median and best wall time of
+each import, and which heavy dependencies it pulled in.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+
+ENTRY_POINTS = {
+    'update job': 'create_db',
+    'transform': 'transform_db',
+    'training': 'model',
+    'inference': 'predict',
+}
+
+HEAVY = ['tensorflow', 'keras', 'sklearn', 'matplotlib', 'nba_api', 'IPython', 'pandas']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def time_import(module, repeat=5):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SCRIPTS, os.environ.get('PYTHONPATH')])))
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                              capture_output=True, text=True, env=env, cwd=SCRIPTS)
+        if proc.returncode != 0:
+            return {'module': module, 'error': proc.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    seconds = [run['seconds'] for run in runs]
+    return {'module': module, 'median_s': statistics.median(seconds), 'min_s': min(seconds),
+            'loaded': runs[-1]['loaded']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out')
+    args = parser.parse_args()
+
+    report = {name: time_import(module, args.repeat) for name, module in ENTRY_POINTS.items()}
+    print(json.dumps(report, indent=1))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
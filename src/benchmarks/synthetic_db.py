@@ -0,0 +1,196 @@
+"""Synthetic NBA database with the schema of create_db, for benchmarks and offline runs.
+
+    python src/benchmarks/synthetic_db.py out.db --seasons 10 [--players-per-team 13]
+
+Every season is a random schedule of `games_per_team` game days where all
+teams play, with box score stats that are internally consistent (PTS adds
+up from the makes, WL follows PTS) so the transform steps behave as they do
+on real data.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from db_writer import batch_writer
+from schema import create_table, column_names
+
+FIRST_TEAM_ID = 1610612737
+
+# Real abbreviations, including relocated ones, so normalize_matchups has work to do
+ABBREVIATIONS = ['ATL', 'BOS', 'NJN', 'CHH', 'CHI', 'CLE', 'DAL', 'DEN', 'DET', 'GSW', 'HOU', 'IND',
+                 'LAC', 'LAL', 'VAN', 'MIA', 'MIL', 'MIN', 'NOH', 'NYK', 'SEA', 'ORL', 'PHI', 'PHX',
+                 'POR', 'SAC', 'SAS', 'TOR', 'UTA', 'WAS']
+
+
+def season_string(season):
+    return str(season) + '-' + str(season+1)[-2:]
+
+
+def schedule(rng, teams, games_per_team):
+    """(home, away, day) arrays: on every day each team plays one game"""
+    homes, aways, days = [], [], []
+    for day in range(games_per_team):
+        order = rng.permutation(teams)
+        homes.append(order[0::2])
+        aways.append(order[1::2])
+        days.append(np.full(teams // 2, day))
+    return np.concatenate(homes), np.concatenate(aways), np.concatenate(days)
+
+
+def team_games(rng, season, teams, games_per_team):
+    """team_basic_boxscores rows of one season, two per game"""
+    home, away, day = schedule(rng, teams, games_per_team)
+    n_games = len(home)
+    game_ids = np.array(['002{:02d}{:05d}'.format(season % 100, i + 1) for i in range(n_games)])
+    dates = (pd.Timestamp('{}-10-20'.format(season)) + pd.to_timedelta(day * 2, unit='D')).strftime('%Y-%m-%d')
+
+    n = 2 * n_games
+    team = np.concatenate([home, away])
+    opp = np.concatenate([away, home])
+    is_home = np.arange(n) < n_games
+
+    fg3a = rng.integers(20, 45, n)
+    fg3m = rng.binomial(fg3a, 0.36)
+    fg2a = rng.integers(45, 70, n)
+    fg2m = rng.binomial(fg2a, 0.52)
+    fta = rng.integers(10, 35, n)
+    ftm = rng.binomial(fta, 0.77)
+    pts = 2 * fg2m + 3 * fg3m + ftm
+
+    # No ties: the home team makes one more free throw
+    tie = np.flatnonzero(pts[:n_games] == pts[n_games:])
+    ftm[tie] += 1
+    fta[tie] = np.maximum(fta[tie], ftm[tie])
+    pts[tie] += 1
+    plus_minus = pts - np.concatenate([pts[n_games:], pts[:n_games]])
+
+    oreb = rng.integers(5, 16, n)
+    dreb = rng.integers(28, 42, n)
+    abbr = np.array(ABBREVIATIONS * (teams // len(ABBREVIATIONS) + 1))[:teams]
+    matchup = np.char.add(np.char.add(abbr[team], np.where(is_home, ' vs. ', ' @ ')), abbr[opp])
+
+    df = pd.DataFrame({
+        'SEASON': season_string(season), 'TEAM_ID': FIRST_TEAM_ID + team, 'TEAM_ABBREVIATION': abbr[team],
+        'TEAM_NAME': np.char.add('Team ', abbr[team]), 'GAME_ID': np.concatenate([game_ids, game_ids]),
+        'GAME_DATE': np.concatenate([dates, dates]), 'MATCHUP': matchup, 'WL': np.where(plus_minus > 0, 'W', 'L'),
+        'MIN': 240, 'FGM': fg2m + fg3m, 'FGA': fg2a + fg3a, 'FG_PCT': (fg2m + fg3m) / (fg2a + fg3a),
+        'FG3M': fg3m, 'FG3A': fg3a, 'FG3_PCT': fg3m / fg3a, 'FTM': ftm, 'FTA': fta, 'FT_PCT': ftm / fta,
+        'OREB': oreb, 'DREB': dreb, 'REB': oreb + dreb, 'AST': rng.integers(15, 35, n),
+        'STL': rng.integers(3, 13, n), 'BLK': rng.integers(1, 10, n), 'TOV': rng.integers(8, 20, n),
+        'PF': rng.integers(14, 26, n), 'PTS': pts, 'PLUS_MINUS': plus_minus,
+    })
+    return df[column_names('team_basic_boxscores')]
+
+
+def _team_columns(basic):
+    return pd.DataFrame({'GAME_ID': basic['GAME_ID'], 'TEAM_ID': basic['TEAM_ID'],
+                         'TEAM_NAME': basic['TEAM_NAME'], 'TEAM_ABBREVIATION': basic['TEAM_ABBREVIATION'],
+                         'TEAM_CITY': 'City', 'MIN': '240:00'})
+
+
+def advanced_games(rng, basic):
+    n = len(basic)
+    df = _team_columns(basic)
+    for col in column_names('team_advanced_boxscores')[6:]:
+        if col.endswith('RATING') and 'NET' not in col:
+            df[col] = rng.normal(110, 8, n).round(1)
+        elif 'NET' in col:
+            df[col] = rng.normal(0, 10, n).round(1)
+        elif col.startswith(('PACE', 'E_PACE', 'POSS')):
+            df[col] = rng.normal(100, 4, n).round(1)
+        elif col in ('AST_TOV', 'AST_RATIO'):
+            df[col] = rng.uniform(1, 20, n).round(2)
+        else:
+            df[col] = rng.uniform(0.05, 0.6, n).round(3)
+    return df
+
+
+def scoring_games(rng, basic):
+    n = len(basic)
+    df = _team_columns(basic)
+    df['PCT_FGA_2PT'] = (basic['FGA'] - basic['FG3A']) / basic['FGA']
+    df['PCT_FGA_3PT'] = 1 - df['PCT_FGA_2PT']
+    df['PCT_PTS_2PT'] = 2 * (basic['FGM'] - basic['FG3M']) / basic['PTS']
+    df['PCT_PTS_2PT_MR'] = df['PCT_PTS_2PT'] * rng.uniform(0.1, 0.4, n)
+    df['PCT_PTS_3PT'] = 3 * basic['FG3M'] / basic['PTS']
+    df['PCT_PTS_FB'] = rng.uniform(0.05, 0.2, n)
+    df['PCT_PTS_FT'] = basic['FTM'] / basic['PTS']
+    df['PCT_PTS_OFF_TOV'] = rng.uniform(0.08, 0.22, n)
+    df['PCT_PTS_PAINT'] = df['PCT_PTS_2PT'] - df['PCT_PTS_2PT_MR']
+    for made in ['2PM', '3PM', 'FGM']:
+        df['PCT_AST_' + made] = rng.uniform(0.4, 0.8, n)
+        df['PCT_UAST_' + made] = 1 - df['PCT_AST_' + made]
+    return df[column_names('team_scoring_boxscores')].round(3)
+
+
+def player_games(rng, basic, players_per_team):
+    """player_game_logs rows: players_per_team per team game, ranks left NULL"""
+    rows = basic.loc[basic.index.repeat(players_per_team)].reset_index(drop=True)
+    n = len(rows)
+    slot = np.tile(np.arange(players_per_team), len(basic))
+    stats = {col: rng.integers(0, 12, n) for col in ['FGM', 'FG3M', 'FTM', 'OREB', 'DREB', 'AST', 'TOV',
+                                                      'STL', 'BLK', 'BLKA', 'PF', 'PFD']}
+    stats['FGA'] = stats['FGM'] + rng.integers(0, 10, n)
+    stats['FG3A'] = stats['FG3M'] + rng.integers(0, 5, n)
+    stats['FTA'] = stats['FTM'] + rng.integers(0, 3, n)
+    stats['REB'] = stats['OREB'] + stats['DREB']
+    stats['PTS'] = 2 * stats['FGM'] + stats['FG3M'] + stats['FTM']
+
+    df = pd.DataFrame({
+        'SEASON_YEAR': rows['SEASON'], 'PLAYER_ID': (rows['TEAM_ID'] - FIRST_TEAM_ID) * 100 + slot + 1,
+        'PLAYER_NAME': 'Player', 'NICKNAME': 'P', 'TEAM_ID': rows['TEAM_ID'],
+        'TEAM_ABBREVIATION': rows['TEAM_ABBREVIATION'], 'TEAM_NAME': rows['TEAM_NAME'], 'GAME_ID': rows['GAME_ID'],
+        'GAME_DATE': rows['GAME_DATE'], 'MATCHUP': rows['MATCHUP'], 'WL': rows['WL'],
+        'MIN': rng.uniform(0, 40, n).round(1), **stats,
+        'FG_PCT': stats['FGM'] / np.maximum(stats['FGA'], 1), 'FG3_PCT': stats['FG3M'] / np.maximum(stats['FG3A'], 1),
+        'FT_PCT': stats['FTM'] / np.maximum(stats['FTA'], 1), 'PLUS_MINUS': rng.integers(-20, 21, n),
+        'NBA_FANTASY_PTS': rng.uniform(0, 50, n).round(1), 'DD2': 0, 'TD3': 0,
+        'WNBA_FANTASY_PTS': rng.uniform(0, 50, n).round(1), 'AVAILABLE_FLAG': 1,
+    })
+    return df
+
+
+def make_database(path, seasons=1, first_season=2013, teams=30, games_per_team=82, players_per_team=13, seed=0):
+    """Writes a fresh database at path with team_basic/advanced/scoring_boxscores
+    and player_game_logs for `seasons` seasons. Returns the row count of each table."""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    tables = ['team_basic_boxscores', 'team_advanced_boxscores', 'team_scoring_boxscores', 'player_game_logs']
+    for table_name in tables:
+        create_table(conn, table_name)
+
+    counts = dict.fromkeys(tables, 0)
+    with batch_writer(conn, max_rows=50000) as writer:
+        for season in range(first_season, first_season + seasons):
+            basic = team_games(rng, season, teams, games_per_team)
+            frames = [basic, advanced_games(rng, basic), scoring_games(rng, basic)]
+            if players_per_team:
+                frames.append(player_games(rng, basic, players_per_team))
+            for table_name, df in zip(tables, frames):
+                writer.add(table_name, df)
+                counts[table_name] += len(df)
+    conn.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic NBA database')
+    parser.add_argument('path')
+    parser.add_argument('--seasons', type=int, default=1, choices=range(1, 51), metavar='1-50')
+    parser.add_argument('--first-season', type=int, default=2013)
+    parser.add_argument('--teams', type=int, default=30)
+    parser.add_argument('--games-per-team', type=int, default=82)
+    parser.add_argument('--players-per-team', type=int, default=13)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(make_database(args.path, args.seasons, args.first_season, args.teams, args.games_per_team,
+                        args.players_per_team, args.seed))
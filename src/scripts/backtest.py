@@ -0,0 +1,166 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from metrics import METRICS
+from predict import MODEL_PATH
+
+# Probabilities are clipped this far from 0 and 1 for the log-loss
+EPS = 1e-7
+
+
+def season_games(data):
+    """One row per game of a convert_pcts frame: GAME_DATE, GAME_ID, HOME, AWAY
+    and WL of the home team, ordered by date"""
+    home = data.loc[data['HOME_GAME'] == 1, ['GAME_ID', 'GAME_DATE', 'TEAM_ABBREVIATION', 'WL']]
+    away = data.loc[data['HOME_GAME'] == 0, ['GAME_ID', 'TEAM_ABBREVIATION']]
+    games = home.merge(away, on='GAME_ID', suffixes=('_HOME', '_AWAY'), validate='one_to_one')
+    games = games.rename(columns={'TEAM_ABBREVIATION_HOME': 'HOME', 'TEAM_ABBREVIATION_AWAY': 'AWAY'})
+    games['HOME'] = games['HOME'].astype(str)
+    games['AWAY'] = games['AWAY'].astype(str)
+    return games.sort_values(['GAME_DATE', 'GAME_ID'], kind='stable').reset_index(drop=True)
+
+
+def calibration(y, p, bins=10):
+    """Reliability table over equal width probability bins (empty bins left out)
+    and the expected calibration error, the games-weighted gap between
+    the mean predicted probability and the win rate of each bin"""
+    which = np.minimum((p * bins).astype(int), bins - 1)
+    table, ece = [], 0.0
+    for b in np.unique(which):
+        mask = which == b
+        mean_prob, win_rate = float(p[mask].mean()), float(y[mask].mean())
+        table.append({'bin': b / bins, 'games': int(mask.sum()), 'mean_prob': mean_prob, 'win_rate': win_rate})
+        ece += mask.sum() / len(y) * abs(mean_prob - win_rate)
+    return table, float(ece)
+
+
+def score(y, p, bins=10):
+    """Accuracy, log-loss, Brier score and calibration of home win probabilities p for outcomes y"""
+    y = np.asarray(y, dtype=np.float64)
+    p = np.asarray(p, dtype=np.float64)
+    if len(y) == 0:
+        return {'games': 0}
+    clipped = np.clip(p, EPS, 1 - EPS)
+    table, ece = calibration(y, p, bins)
+    return {'games': len(y),
+            'accuracy': float(((p > 0.5) == (y == 1)).mean()),
+            'log_loss': float(-(y * np.log(clipped) + (1 - y) * np.log(1 - clipped)).mean()),
+            'brier': float(((p - y) ** 2).mean()),
+            'home_win_rate': float(y.mean()),
+            'ece': ece,
+            'calibration': table}
+
+
+def backtest_season(job):
+    """Replays one season day by day with a saved model.
+
+    The team_form state is warmed up with the season before (when the
+    database has it), then for each game day the games of the day are
+    scored in one batch from the state, and only after that are the day's
+    results folded in, so every prediction only sees games already played.
+    Games where a team hasn't played window_size games yet, or isn't in
+    the store vocabulary, are skipped and counted.
+    """
+    from feature_store import feature_store
+    from predict import predictor
+    from team_form import team_form
+    from transform_db import transform, season_string
+
+    start = time.perf_counter()
+    season = job['season']
+    conn = sqlite3.connect(job['db'])
+    obj = transform(conn=conn, start_season=season - 1, end_season=season)
+    data = obj.clean_team_data(obj.load_team_data())
+    data = obj.convert_pcts(data.dropna(subset='PCT_PTS_2PT'))
+    conn.close()
+
+    store = feature_store(job['store'])
+    form = team_form([col for col in store.columns if col != store.meta['group']], job['window_size'])
+    in_season = (data['SEASON'] == season_string(season)).to_numpy()
+    form.update(data.loc[~in_season])
+    data = data.loc[in_season]
+    model = predictor(job['model'], store, form)
+
+    # Every day's rows are folded in, even on days none of the games pair
+    # up into a home and away row, so the state never misses a game
+    games = dict(list(season_games(data).groupby('GAME_DATE', sort=True)))
+    y, p, skipped = [], [], 0
+    for date, rows in data.groupby('GAME_DATE', sort=True, observed=True):
+        day = games.get(date)
+        if day is not None:
+            ready = np.array([all(team in store.vocab and team in form.team_index
+                                  and form.games(team) >= form.window_size for team in game)
+                              for game in zip(day['HOME'], day['AWAY'])])
+            skipped += int((~ready).sum())
+            if ready.any():
+                p.append(model.predict(list(zip(day['HOME'][ready], day['AWAY'][ready]))))
+                y.append(day['WL'].to_numpy()[ready])
+        form.update(rows)
+
+    y = np.concatenate(y) if y else np.zeros(0)
+    p = np.concatenate(p) if p else np.zeros(0)
+    result = score(y, p)
+    result.update({'season': season_string(season), 'skipped': skipped,
+                   'seconds': time.perf_counter() - start})
+    return result, y, p
+
+
+def _init_worker(threads):
+    """Keeps each worker's TensorFlow to its share of the cores"""
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run(db_path, store_root, start_season, end_season, model_path=MODEL_PATH, window_size=10, workers=None):
+    """Backtests every season from start_season to end_season, one season
+    per task of a process pool. Returns the per season results, in season
+    order, and the scores over all seasons pooled."""
+    seasons = list(range(start_season, end_season + 1))
+    workers = min(workers or os.cpu_count() or 1, len(seasons))
+    threads = max((os.cpu_count() or 1) // workers, 1)
+    jobs = [{'db': db_path, 'store': store_root, 'model': model_path, 'season': season,
+             'window_size': window_size} for season in seasons]
+
+    with METRICS.stage('backtest.run') as stage:
+        # TensorFlow doesn't survive a fork, so the workers are spawned
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            results = list(pool.map(backtest_season, jobs))
+        stage['rows'] = sum(len(y) for _, y, _ in results)
+
+    for result, _, _ in results:
+        print('{season}: {games} games, accuracy {accuracy:.3f}, log-loss {log_loss:.4f}'.format(
+            **result) if result['games'] else '{season}: no games scored'.format(**result))
+
+    overall = score(np.concatenate([y for _, y, _ in results]), np.concatenate([p for _, _, p in results]))
+    return [result for result, _, _ in results], overall
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of a saved model, one season per process')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--store', required=True, help='feature store root the model was trained on')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--seasons', nargs=2, type=int, default=[2013, 2023])
+    parser.add_argument('--window-size', type=int, default=10)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    seasons, overall = run(args.db, args.store, *args.seasons, model_path=args.model,
+                           window_size=args.window_size, workers=args.workers)
+    results = {'model': args.model, 'seasons': seasons, 'overall': overall}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        print(json.dumps(results, indent=1))
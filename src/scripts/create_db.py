@@ -1,33 +1,52 @@
+import functools
 import sqlite3
+import sys
 from sqlite3 import Error
 
-from nba_api.stats.static import players, teams
-from nba_api.stats.library.parameters import SeasonAll
-from nba_api.stats.endpoints import leaguegamelog
-from nba_api.stats.endpoints import boxscoreadvancedv2
-from nba_api.stats.endpoints import boxscorescoringv2
-from nba_api.stats.endpoints import playergamelogs
-from nba_api.stats.endpoints import playerindex
-
-from IPython.core.display import clear_output
-
 from tqdm import tqdm
 
 import pandas as pd
-import time 
 
 from transform_db import transform
+from fetch import fetch_engine, league_game_log, advanced_boxscore, scoring_boxscore, player_game_logs
+from db_writer import batch_writer
+from schema import create_table, migrate, missing_games_sql, RANK_COLUMNS
+from jobs import job_queue, PENDING, FAILED
+from http_cache import response_cache
+from metrics import METRICS, instrument
+
+# Tables that are filled one game at a time and the fetch function for each
+GAME_ENDPOINTS = {
+    'team_advanced_boxscores': advanced_boxscore,
+    'team_scoring_boxscores': scoring_boxscore,
+}
+
+def clear_output(wait=False):
+    """Clears the notebook cell output; a no-op when not running under IPython"""
+    if 'IPython' in sys.modules:
+        from IPython.display import clear_output as clear
+        clear(wait=wait)
+
+def fetch_game(pair, cache=None):
+    game_id, table_name = pair
+    return GAME_ENDPOINTS[table_name](game_id, cache)
 
 def season_string(season):
         return str(season) + '-' + str(season+1)[-2:]
 
 class db:
-    def __init__(self, conn):
+    def __init__(self, conn, engine=None, max_rows=5000, max_seconds=5.0, cache=None):
         self.conn = conn
+        # response_cache every nba_api call of this object goes through, None to always hit the network
+        self.cache = cache
+        self.engine = engine if engine is not None else fetch_engine()
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
         self.season_boxscores = []
         self.season_df = None
         self.players = []
         self.player_df = None
+        self.jobs = job_queue(conn)
 
     def create_connection(self, db_file):
         """ create a database connection to a SQLite database """
@@ -41,6 +60,106 @@ class db:
             if self.conn:
                 self.conn.close()
     
+    def migrate(self):
+        """Converts tables created before the typed schema to keyed tables in place"""
+        migrate(self.conn)
+
+    def writer(self):
+        """Buffered writer that flushes every max_rows rows or max_seconds seconds"""
+        return batch_writer(self.conn, max_rows=self.max_rows, max_seconds=self.max_seconds)
+
+    def run_jobs(self, table_name, game_ids):
+        """Fetches every game in game_ids for table_name. Returns the GAME_IDs that failed."""
+        return self.run_pairs([(game_id, table_name) for game_id in game_ids], [table_name])[table_name]
+
+    def run_pairs(self, pairs, table_names=()):
+        """Fetches every (GAME_ID, table_name) pair through one pass of self.engine,
+        so the calls for every table share the same workers and rate limit.
+
+        Each game is marked done or failed in the ingest_jobs ledger in the
+        same transaction as its rows, so after a crash the ledger and the
+        table agree and resume() only fetches what is left.
+        Returns {table_name: failed GAME_IDs}, with an entry for every table
+        in table_names even when it had no games to fetch.
+        """
+        failed = {table_name: [] for table_name in table_names}
+        for _, table_name in pairs:
+            failed.setdefault(table_name, [])
+
+        with METRICS.stage('db.fetch_games', games=len(pairs)) as stage:
+            writer = self.writer()
+            fetch = functools.partial(fetch_game, cache=self.cache)
+            # Metrics per endpoint (fetch.advanced_boxscore, ...) rather than all under fetch_game
+            results = self.engine.map(fetch, pairs, metric=lambda pair: GAME_ENDPOINTS[pair[1]].__name__)
+            rows = 0
+            for (game_id, table_name), boxscores, error in tqdm(results, total=len(pairs), desc='progress'):
+                if error is None and len(boxscores) == 0:
+                    # Marked done it would never be fetched again
+                    error = ValueError('empty response')
+                if error is not None:
+                    self.jobs.mark_failed(table_name, game_id, error)
+                    failed[table_name].append(game_id)
+                    continue
+                writer.add(table_name, boxscores)
+                rows += len(boxscores)
+                self.jobs.mark_done(table_name, game_id)
+            writer.flush()
+            stage['rows'] = rows
+            stage['failed'] = sum(len(ids) for ids in failed.values())
+
+        return failed
+
+    def missing_games(self, season, dates=(), table_names=None, refresh=False):
+        """(GAME_ID, table_name) for the games of a season in team_basic_boxscores
+        that are missing from the per-game tables, found with one query.
+        With refresh every game on dates is listed, whether it has rows or not."""
+        table_names = table_names or list(GAME_ENDPOINTS)
+        for table_name in table_names:
+            create_table(self.conn, table_name)
+
+        dates = [pd.Timestamp(date).strftime('%Y-%m-%d') for date in dates]
+        sql = missing_games_sql(table_names, len(dates), missing_only=not (refresh and dates))
+        return self.conn.execute(sql, [season_string(season)] + dates).fetchall()
+
+    @instrument('db.update_games', rows=False)
+    def update_games(self, season, dates=(), table_names=None, refresh=False):
+        """Fetches every game missing from the per-game tables in one shared pipeline.
+        Run update_team_basic_boxscores first, it is the list of games to look for.
+        dates restricts it to the games on those dates; with refresh those games
+        are fetched again even when they already have rows (the rows are upserted)."""
+        table_names = table_names or list(GAME_ENDPOINTS)
+        pairs = self.missing_games(season, dates, table_names, refresh)
+        print("num_games_updated:", len(pairs))
+        if len(pairs) == 0:
+            print("All per game boxscores up to date in season {}".format(season_string(season)))
+            return {table_name: [] for table_name in table_names}
+
+        season_str = season_string(season)
+        for table_name in set(name for _, name in pairs):
+            self.jobs.enqueue(table_name, season_str, [game_id for game_id, name in pairs if name == table_name],
+                              reset=True)
+        return self.run_pairs(pairs, table_names)
+
+    @instrument('db.resume', rows=False)
+    def resume(self, table_name=None, seasons=None, statuses=(PENDING,)):
+        """Runs the jobs left in the ledger, for one table or all of them.
+        Returns {table_name: failed GAME_IDs}."""
+        table_names = [table_name] if table_name else list(GAME_ENDPOINTS)
+        seasons = [season_string(season) for season in seasons] if seasons else None
+
+        pairs = []
+        for name in table_names:
+            create_table(self.conn, name)
+            game_ids = self.jobs.game_ids(name, statuses=statuses, seasons=seasons)
+            print('{} games to fetch for {}'.format(len(game_ids), name))
+            pairs.extend((game_id, name) for game_id in game_ids)
+        return self.run_pairs(pairs, table_names)
+
+    def retry_failed(self, table_name=None, seasons=None):
+        """Fetches only the games whose last attempt failed"""
+        return self.resume(table_name, seasons, statuses=(FAILED,))
+
+    @instrument('db.add_basic_boxscores', rows=False)
     def add_basic_boxscores(self, start_season, end_season, if_exists='replace'):
     
         table_name = 'team_basic_boxscores'
@@ -49,40 +168,35 @@ class db:
             self.conn.execute('DROP TABLE IF EXISTS ' + table_name)
             self.conn.execute('VACUUM')
 
-        self.conn.execute("""CREATE TABLE IF NOT EXISTS {} (SEASON, TEAM_ID, TEAM_ABBREVIATION, 
-            TEAM_NAME, GAME_ID, GAME_DATE DATE, MATCHUP, WL, MIN, FGM, FGA, 
-            FG_PCT, FG3M, FG3A , FG3_PCT, FTM, FTA, FT_PCT, OREB,
-            DREB, REB, AST, STL, BLK, TOV, PF, PTS, 
-            PLUS_MINUS)""".format(table_name))    
+        create_table(self.conn, table_name)
 
+        writer = self.writer()
         for season in range(start_season, end_season+1):
             season_str = season_string(season)
+            self.season_boxscores = []
 
             for season_type in ['Regular Season', 'Playoffs']:
-                boxscores = leaguegamelog.LeagueGameLog(season=season_str, season_type_all_star=season_type).get_data_frames()[0]
+                boxscores = self.engine.call(league_game_log, season_str, season_type, cache=self.cache)
                 self.season_boxscores.append(boxscores)
-                time.sleep(2)
             self.season_df = pd.concat(self.season_boxscores)
             self.season_df['SEASON'] = season_str
             self.season_df.drop(columns = ['SEASON_ID', 'VIDEO_AVAILABLE'], inplace=True)
 
-            self.season_df.to_sql(table_name, self.conn, if_exists='append', index=False)
-
-            time.sleep(3)
-
-        cur = self.conn.cursor()
-        cur.execute('DELETE FROM {} WHERE rowid NOT IN (SELECT min(rowid) FROM {} GROUP BY TEAM_ID, GAME_ID)'.format(table_name, table_name))
-        self.conn.commit()
+            writer.add(table_name, self.season_df)
+        writer.flush()
 
         return None
     
+    @instrument('db.add_advanced_boxscores', rows=False)
     def add_advanced_boxscores(self, start_season, end_season, if_exists='replace'):
         """
         This function pulls advanced team boxscores from the NBA_API package 
         and appends (or creates a new table if not exists) it to the table team_advanced_boxscores in the sqlite db
 
-        Note: Because of timeout errors and that we have to pull each game's individually, each season takes 1-2 hours.
-        If some games were not pulled in certain seasons, you can use the update functions to gather those individual games.
+        Note: Each game has to be pulled individually. The calls go through self.engine, which
+        runs them concurrently under a shared rate limit and retries timeouts with backoff.
+        Games that still fail are recorded as failed in the ingest_jobs table; retry_failed fetches
+        just those, and calling this again with if_exists='append' resumes an interrupted run.
         """
 
         table_name = 'team_advanced_boxscores'
@@ -91,45 +205,37 @@ class db:
         if if_exists == 'replace':
             self.conn.execute('DROP TABLE IF EXISTS ' + table_name)
             self.conn.execute('VACUUM')
+            self.jobs.clear(table_name)
 
-        self.conn.execute('''CREATE TABLE IF NOT EXISTS {} (GAME_ID, TEAM_ID, TEAM_NAME, 
-            TEAM_ABBREVIATION, TEAM_CITY, MIN, E_OFF_RATING, OFF_RATING, E_DEF_RATING, 
-            DEF_RATING, E_NET_RATING, NET_RATING, AST_PCT, AST_TOV, 
-            AST_RATIO, OREB_PCT, DREB_PCT, REB_PCT, E_TM_TOV_PCT, 
-            TM_TOV_PCT, EFG_PCT, TS_PCT, USG_PCT, E_USG_PCT, E_PACE, 
-            PACE, PACE_PER40, POSS, PIE)'''.format(table_name))
+        create_table(self.conn, table_name)
 
 
         for season in range(start_season, end_season+1):
             season_str = season_string(season)
-            season_team_boxscores = []
 
             for season_type in ['Regular Season', 'Playoffs']:
-                logs = leaguegamelog.LeagueGameLog(season=season, season_type_all_star=season_type).get_data_frames()[0]
+                logs = self.engine.call(league_game_log, season_str, season_type, cache=self.cache)
                 game_ids = logs['GAME_ID'].unique()
 
                 print('{} games {}'.format(season,len(game_ids)))
-                for game_id in tqdm(game_ids, desc='progress'):
-                    try:
-                        team_boxscores = boxscoreadvancedv2.BoxScoreAdvancedV2(game_id).get_data_frames()[1]                    
-                        team_boxscores.to_sql(table_name, self.conn, if_exists='append', index=False)
-                    except:
-                        game_ids_not_added.append(game_id)
-                clear_output(wait=True)
-
-        cur = self.conn.cursor()
-        cur.execute('DELETE FROM {} WHERE rowid NOT IN (SELECT min(rowid) FROM {} GROUP BY TEAM_ID, GAME_ID)'.format(table_name, table_name))
-        self.conn.commit()
+                self.jobs.enqueue(table_name, season_str, game_ids)
 
-        return None
+            # Games already done in an earlier (interrupted) run are skipped
+            game_ids_not_added.extend(self.run_jobs(table_name, self.jobs.game_ids(table_name, seasons=[season_str])))
+            clear_output(wait=True)
+
+        return game_ids_not_added
     
+    @instrument('db.add_scoring_boxscores', rows=False)
     def add_scoring_boxscores(self, start_season, end_season, if_exists='replace'):
         """
         This function pulls scoring team boxscores from the NBA_API package 
         and appends (or creates a new table if not exists) it to the table team_scoring_boxscores in the sqlite db.
 
-        Note: Because of timeout errors and that we have to pull each game's individually, each season takes 1-2 hours.
-        If some games were not pulled in certain seasons, you can use the update functions to gather those individual games.
+        Note: Each game has to be pulled individually. The calls go through self.engine, which
+        runs them concurrently under a shared rate limit and retries timeouts with backoff.
+        Games that still fail are recorded as failed in the ingest_jobs table; retry_failed fetches
+        just those, and calling this again with if_exists='append' resumes an interrupted run.
         """
 
         table_name = 'team_scoring_boxscores'
@@ -138,39 +244,32 @@ class db:
         if if_exists == 'replace':
             self.conn.execute('DROP TABLE IF EXISTS ' + table_name)
             self.conn.execute('VACUUM')
+            self.jobs.clear(table_name)
 
-        conn.execute('''CREATE TABLE IF NOT EXISTS {} (GAME_ID, TEAM_ID, TEAM_NAME, TEAM_ABBREVIATION, TEAM_CITY,
-           MIN, PCT_FGA_2PT, PCT_FGA_3PT, PCT_PTS_2PT, PCT_PTS_2PT_MR,
-           PCT_PTS_3PT, PCT_PTS_FB, PCT_PTS_FT, PCT_PTS_OFF_TOV,
-           PCT_PTS_PAINT, PCT_AST_2PM, PCT_UAST_2PM, PCT_AST_3PM,
-           PCT_UAST_3PM, PCT_AST_FGM, PCT_UAST_FGM)'''.format(table_name))
+        create_table(self.conn, table_name)
 
 
         for season in range(start_season, end_season+1):
             season_str = season_string(season)
-            season_team_boxscores = []
 
             for season_type in ['Regular Season', 'Playoffs']:
-                logs = leaguegamelog.LeagueGameLog(season=season, season_type_all_star=season_type).get_data_frames()[0]
+                logs = self.engine.call(league_game_log, season_str, season_type, cache=self.cache)
                 game_ids = logs['GAME_ID'].unique()
 
                 print('{} games {} in {}'.format(season_type ,len(game_ids), season))
-                for game_id in tqdm(game_ids, desc='progress'):
-                    try:
-                        player_logs = boxscorescoringv2.BoxScoreScoringV2(game_id).get_data_frames()[1]
-                        player_logs.to_sql(table_name, self.conn, if_exists='append', index=False)
-                    except:
-                        game_ids_not_added.append(game_id)
-                    time.sleep(.5)
-                clear_output(wait=True)
-
-        cur = self.conn.cursor()
-        cur.execute('DELETE FROM {} WHERE rowid NOT IN (SELECT min(rowid) FROM {} GROUP BY TEAM_ID, GAME_ID)'.format(table_name, table_name))
-        self.conn.commit()
+                self.jobs.enqueue(table_name, season_str, game_ids)
+
+            # Games already done in an earlier (interrupted) run are skipped
+            game_ids_not_added.extend(self.run_jobs(table_name, self.jobs.game_ids(table_name, seasons=[season_str])))
+            clear_output(wait=True)
 
         return game_ids_not_added
     
-    def add_player_game_logs(self, start_season, end_season, if_exists='replace'):
+    @instrument('db.add_player_game_logs', rows=False)
+    def add_player_game_logs(self, start_season, end_season, if_exists='replace', skip_ranks=False, chunksize=5000):
+        """Pulls a season of player game logs at a time and writes it in chunks of chunksize rows,
+        so at most one season's response is held in memory. With skip_ranks the *_RANK columns
+        (about half of the table) are dropped before they are buffered and stay NULL."""
         table_name = 'player_game_logs'
         game_ids_not_added = []
 
@@ -178,210 +277,118 @@ class db:
             self.conn.execute('DROP TABLE IF EXISTS ' + table_name)
             self.conn.execute('VACUUM')
 
-        conn.execute('''CREATE TABLE IF NOT EXISTS {} (SEASON_YEAR, PLAYER_ID, PLAYER_NAME, NICKNAME, TEAM_ID, TEAM_ABBREVIATION, TEAM_NAME,
-            GAME_ID, GAME_DATE, MATCHUP, WL, MIN, FGM, FGA, FG_PCT, FG3M, FG3A, FG3_PCT, FTM,FTA, FT_PCT, OREB,
-            DREB, REB, AST, TOV, STL, BLK, BLKA, PF, PFD, PTS, PLUS_MINUS, NBA_FANTASY_PTS, DD2, TD3, GP_RANK,
-            W_RANK, L_RANK, W_PCT_RANK, MIN_RANK, FGM_RANK, FGA_RANK, FG_PCT_RANK, FG3M_RANK, FG3A_RANK, FG3_PCT_RANK,
-            FTM_RANK, FTA_RANK, FT_PCT_RANK, OREB_RANK, DREB_RANK, REB_RANK, AST_RANK, TOV_RANK, STL_RANK, BLK_RANK,
-            BLKA_RANK, PF_RANK, PFD_RANK, PTS_RANK, PLUS_MINUS_RANK, NBA_FANTASY_PTS_RANK, DD2_RANK, TD3_RANK, WNBA_FANTASY_PTS,WNBA_FANTASY_PTS_RANK,AVAILABLE_FLAG)'''.format(table_name))
+        create_table(self.conn, table_name)
         
+        writer = self.writer()
         for season in range(start_season, end_season+1):
             season_str = season_string(season)
-            season_team_boxscores = []
 
-            scoring_boxscores = playergamelogs.PlayerGameLogs(season_nullable=season_str,league_id_nullable='00').get_data_frames()[0]
-            scoring_boxscores.to_sql(table_name, self.conn, if_exists='append', index=False)
-            
-            time.sleep(.5)
+            logs = self.engine.call(player_game_logs, season_str, cache=self.cache)
+            if skip_ranks:
+                logs = logs.drop(columns=RANK_COLUMNS, errors='ignore')
+            print('{} player games in {}'.format(len(logs), season_str))
 
-        cur = self.conn.cursor()
-        self.conn.commit()
+            for start in range(0, len(logs), chunksize):
+                writer.add(table_name, logs.iloc[start:start + chunksize])
+            del logs
+        writer.flush()
 
         return game_ids_not_added
     
-    def add_boxscores_db(self, if_exists='replace'):
+    @instrument('db.add_boxscores_db', rows=False)
+    def add_boxscores_db(self, if_exists='replace', start_season=2013, end_season=None):
+        """Builds the boxscore matchup table (one row per game, home team first).
+
+        With if_exists='replace' the table is rebuilt from every season.
+        With if_exists='append' only the games the table doesn't have yet are
+        transformed and upserted, so a nightly refresh costs as much as the new
+        games, and a game whose advanced or scoring rows came in late (after
+        retry_failed, say) is picked up on the next run.
+        end_season defaults to the latest season in team_basic_boxscores.
+        """
         table_name = 'boxscore'
 
         if if_exists == 'replace':
             self.conn.execute('DROP TABLE IF EXISTS ' + table_name)
             self.conn.execute('VACUUM')
 
-        conn.execute('''CREATE TABLE IF NOT EXISTS {} (SEASON_home, TEAM_ID_home, TEAM_ABBREVIATION_home,
-        TEAM_NAME_home, GAME_ID, GAME_DATE_home, MATCHUP_home,
-        HOME_GAME_home, WL_home, FG2M_home, FG2A_home, FG3M_home, FG3A_home,
-        FTM_home, FTA_home, OREB_home, DREB_home, REB_home,
-        AST_home, STL_home, BLK_home, TOV_home, PF_home, PTS_home,
-        PLUS_MINUS_home, E_OFF_RATING_home, OFF_RATING_home,
-        E_DEF_RATING_home, DEF_RATING_home, E_NET_RATING_home,
-        NET_RATING_home, POSS_home, PIE_home, PTS_2PT_MR_home,
-        PTS_FB_home, PTS_OFF_TOV_home, PTS_PAINT_home, AST_2PM_home,AST_3PM_home, UAST_2PM_home, UAST_3PM_home, SEASON_away,
-        TEAM_ID_away, TEAM_ABBREVIATION_away, TEAM_NAME_away, GAME_DATE_away, MATCHUP_away, HOME_GAME_away, WL_away, FG2M_away, FG2A_away,
-        FG3M_away, FG3A_away, FTM_away, FTA_away, OREB_away, DREB_away, REB_away, AST_away, STL_away, BLK_away, TOV_away, PF_away, PTS_away, PLUS_MINUS_away, E_OFF_RATING_away, OFF_RATING_away,
-        E_DEF_RATING_away, DEF_RATING_away, E_NET_RATING_away, NET_RATING_away, POSS_away, PIE_away, PTS_2PT_MR_away, PTS_FB_away,
-        PTS_OFF_TOV_away, PTS_PAINT_away, AST_2PM_away, AST_3PM_away, UAST_2PM_away, UAST_3PM_away)'''.format(table_name))
-
-        obj = transform(conn=conn,start_season=2013,end_season=2023)
-        data = obj.load_team_data()
+        create_table(self.conn, table_name)
+
+        if end_season is None:
+            create_table(self.conn, 'team_basic_boxscores')
+            latest = self.conn.execute('SELECT max(SEASON) FROM team_basic_boxscores').fetchone()[0]
+            if latest is None:
+                raise ValueError('team_basic_boxscores is empty, run add_basic_boxscores first')
+            end_season = int(latest[:4])
+
+        obj = transform(conn=self.conn,start_season=start_season,end_season=end_season)
+        data = obj.load_team_data(missing_from=table_name if if_exists == 'append' else None)
         cleaned = obj.clean_team_data(data)
         cleaned = cleaned.dropna(subset='PCT_PTS_2PT')
         convert_pct = obj.convert_pcts(cleaned)
-        matchups = obj.create_matchups(convert_pct)
-        df = matchups
+        df = obj.create_matchups(convert_pct)
+
+        print('{} games added to {}'.format(len(df), table_name))
+        if len(df) == 0:
+            return None
 
-        df = df[df['HOME_GAME_home'] == 1]
+        writer = self.writer()
+        writer.add(table_name, df)
+        writer.flush()
 
-        df.to_sql(table_name, self.conn, if_exists='replace', index=False)
-        self.conn.commit
-    
+    @instrument('db.update_team_basic_boxscores', rows=False)
     def update_team_basic_boxscores(self, season):
         table_name = 'team_basic_boxscores'
         season_str = season_string(season)
+        create_table(self.conn, table_name)
 
         dfs = []
         for season_type in ['Regular Season', 'Playoffs']:
-            team_gamelogs = leaguegamelog.LeagueGameLog(season=season_str, season_type_all_star=season_type).get_data_frames()[0]
+            team_gamelogs = self.engine.call(league_game_log, season_str, season_type, cache=self.cache)
             dfs.append(team_gamelogs)
 
         team_gamelogs_updated = pd.concat(dfs)
         team_gamelogs_updated['SEASON'] = season_str
         team_gamelogs_updated.drop(columns = ['SEASON_ID', 'VIDEO_AVAILABLE'], inplace=True)
 
-        team_gamelogs_updated.to_sql(table_name, self.conn, if_exists='append', index=False)
-
-        cur = self.conn.cursor()
-        cur.execute('DELETE FROM {} WHERE rowid NOT IN (SELECT min(rowid) FROM {} GROUP BY TEAM_ID, GAME_ID)'.format(table_name, table_name))
-        self.conn.commit()
+        writer = self.writer()
+        writer.add(table_name, team_gamelogs_updated)
+        writer.flush()
 
         return None
     
     def update_team_advanced_boxscores(self, season, dates):
-        table_name = 'team_advanced_boxscores'
-
-        season_str = season_string(season)
-
-        game_ids_not_added = []
-
-        # Pull the GAME_IDs from my data
-        game_ids_in_db = pd.read_sql('''SELECT DISTINCT team_basic_boxscores.GAME_ID FROM team_basic_boxscores
-                    INNER JOIN team_advanced_boxscores 
-                    ON team_basic_boxscores.GAME_ID = team_advanced_boxscores.GAME_ID
-                    AND team_basic_boxscores.TEAM_ID = team_advanced_boxscores.TEAM_ID
-                    WHERE SEASON = "{}" '''.format(season_str), self.conn)
-
-        game_ids_in_db = game_ids_in_db['GAME_ID'].tolist()
-
-        missing_game_ids = []
-        if len(dates) != 0:
-            for date in dates:
-                gamelogs = leaguegamelog.LeagueGameLog(
-                    season=season_str, date_from_nullable=date, date_to_nullable=date).get_data_frames()[0]
-                missing_game_ids.extend(gamelogs['GAME_ID'].unique())
-
-        else:        
-            # get up to date GAME_IDs
-            to_date_game_ids = []
-            for season_type in ['Regular Season', 'Playoffs']:
-                to_date_gamelogs = leaguegamelog.LeagueGameLog(season=season_str, season_type_all_star=season_type).get_data_frames()[0]
-                to_date_game_ids.extend(to_date_gamelogs['GAME_ID'].unique())
-
-            # See which game_ids are missing
-            missing_game_ids = set(to_date_game_ids) - set(game_ids_in_db)
-
-        num_games_updated = len(missing_game_ids)
-        print("num_games_updated:", num_games_updated)
-
-        if num_games_updated == 0:
-            print("All team advanced boxscores up to date in season {}".format(season_str))
-            return None
-
-        for game_id in tqdm(missing_game_ids, desc='progress'):
-            try:
-                boxscores = boxscoreadvancedv2.BoxScoreAdvancedV2(game_id).get_data_frames()[1]
-                boxscores.to_sql(table_name, self.conn, if_exists='append', index=False)
-                time.sleep(1)
-            except:
-                game_ids_not_added.append(game_id)  
-
-        cur = self.conn.cursor()
-        cur.execute('DELETE FROM {} WHERE rowid NOT IN (SELECT max(rowid) FROM {} GROUP BY TEAM_ID, GAME_ID)'.format(table_name, table_name))
-        self.conn.commit()
-
-        return game_ids_not_added
+        """Without dates fetches the season's games missing from team_advanced_boxscores.
+        With dates every game on them is fetched again, as before; the games are
+        read from team_basic_boxscores, so update that first.
+        Returns the GAME_IDs that failed."""
+        return self.update_games(season, dates, ['team_advanced_boxscores'],
+                                 refresh=True).get('team_advanced_boxscores', [])
     
     def update_team_scoring_boxscores(self, season, dates):
-        table_name = 'team_scoring_boxscores'
-
-        season_str = season_string(season)
-
-        game_ids_not_added = []
-
-        # Pull the GAME_IDs from my data
-        game_ids_in_db = pd.read_sql(f'''SELECT DISTINCT team_scoring_boxscores.GAME_ID FROM team_basic_boxscores
-                    INNER JOIN team_scoring_boxscores 
-                    ON team_basic_boxscores.GAME_ID = team_scoring_boxscores.GAME_ID
-                    AND team_basic_boxscores.TEAM_ID = team_scoring_boxscores.TEAM_ID
-                    WHERE SEASON = "{season_str}" ''', self.conn)
-
-        game_ids_in_db = game_ids_in_db['GAME_ID'].tolist()
-
-        missing_game_ids = []
-        if len(dates) != 0:
-            for date in dates:
-                gamelogs = leaguegamelog.LeagueGameLog(
-                    season=season_str, date_from_nullable=date, date_to_nullable=date).get_data_frames()[0]
-                missing_game_ids.extend(gamelogs['GAME_ID'].unique())
-
-        else:
-            # get up to date GAME_IDs
-            to_date_game_ids = []
-            for season_type in ['Regular Season', 'Playoffs']:
-                to_date_gamelogs = leaguegamelog.LeagueGameLog(
-                    season=season_str, season_type_all_star=season_type).get_data_frames()[0]
-                to_date_game_ids.extend(to_date_gamelogs['GAME_ID'].unique())
-
-            # See which game_ids are missing
-            missing_game_ids = set(to_date_game_ids) - set(game_ids_in_db)
-
-        num_games_updated = len(missing_game_ids)
-        print("num_games_updated:", num_games_updated)
-
-        if num_games_updated == 0:
-            print("All team advanced boxscores up to date in season {}".format(season_str))
-            return None
-
-        for game_id in tqdm(missing_game_ids, desc='progress'):
-            try:
-                boxscores = boxscorescoringv2.BoxScoreScoringV2(
-                    game_id).get_data_frames()[1]
-                boxscores.to_sql(table_name, self.conn,
-                                 if_exists='append', index=False)
-                time.sleep(2)
-            except:
-                game_ids_not_added.append(game_id)
-
-        cur = self.conn.cursor()
-        cur.execute('DELETE FROM {} WHERE rowid NOT IN (SELECT max(rowid) FROM {} GROUP BY TEAM_ID, GAME_ID)'.format(
-            table_name, table_name))
-        self.conn.commit()
-
-        return game_ids_not_added
+        """Like update_team_advanced_boxscores, for team_scoring_boxscores"""
+        return self.update_games(season, dates, ['team_scoring_boxscores'],
+                                 refresh=True).get('team_scoring_boxscores', [])
 
     
 
-def update_all_data(conn, season, dates):
-    """Combines all the update functions above into one function that updates all my data"""
-    obj = db(conn=conn)
+def update_all_data(conn, season, dates, cache=None):
+    """Combines all the update functions above into one function that updates all my data.
+    Games on dates are fetched again even if they are already in the db.
+    With a response_cache, the game logs the three updates share are fetched once."""
+    obj = db(conn=conn, cache=cache)
     print("updating basic team boxscores")
     obj.update_team_basic_boxscores(season=season)
-    print("updating advanced team/player boxscores")
-    obj.update_team_advanced_boxscores(season=season,dates=dates)
-    print("updating scoring boxscores")
-    obj.update_team_scoring_boxscores(season=season,dates=dates)
+    print("updating advanced and scoring boxscores")
+    obj.update_games(season=season,dates=dates,refresh=True)
+    print("updating boxscore matchups")
+    obj.add_boxscores_db(if_exists='append')
     
     
 if __name__ == '__main__':
     conn = sqlite3.connect("C:\\Users\\alexp\\src\\NBA_Models\\sqlite\\db\\nba_data.db")
-    obj = db(conn=conn)
+    obj = db(conn=conn, cache=response_cache("C:\\Users\\alexp\\src\\NBA_Models\\sqlite\\http_cache"))
+    obj.migrate()
     obj.add_boxscores_db()
     #obj.add_basic_boxscores(2013,2023)
     #obj.add_advanced_boxscores(2013,2023)
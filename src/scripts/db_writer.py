@@ -0,0 +1,91 @@
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+from schema import TABLES, upsert_sql
+
+# pandas hands back numpy scalars for some dtypes; let sqlite3 bind them directly
+for np_type, py_type in [(np.int64, int), (np.int32, int), (np.int16, int), (np.int8, int),
+                         (np.float64, float), (np.float32, float), (np.bool_, int)]:
+    sqlite3.register_adapter(np_type, py_type)
+sqlite3.register_adapter(pd.Timestamp, lambda ts: ts.isoformat(' '))
+
+
+def set_bulk_pragmas(conn):
+    """WAL lets readers keep going during a load and synchronous=NORMAL
+    only syncs at checkpoints, which is safe in WAL mode."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+
+
+def insert_sql(table_name, columns):
+    """Upsert on the primary key for tables in the schema, plain insert otherwise"""
+    if table_name in TABLES:
+        return upsert_sql(table_name, columns)
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        table_name, ', '.join(columns), ', '.join(['?'] * len(columns)))
+
+
+class batch_writer:
+    """Collects rows for one or more tables and writes them with executemany.
+
+    Rows are buffered until `max_rows` rows are pending or `max_seconds`
+    have passed since the last flush, then every buffer is written in a
+    single explicit transaction. Use it as a context manager so the tail
+    of the buffer is flushed when the load finishes.
+    """
+
+    def __init__(self, conn, max_rows=5000, max_seconds=5.0, bulk_pragmas=True):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.buffers = {}
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+        if bulk_pragmas:
+            set_bulk_pragmas(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, table_name, df):
+        """Buffers the rows of df for table_name, flushing if a threshold is hit"""
+        if len(df) == 0:
+            return
+        key = (table_name, tuple(df.columns))
+        self.buffers.setdefault(key, []).extend(df.itertuples(index=False, name=None))
+        self.pending += len(df)
+
+        if self.pending >= self.max_rows or time.monotonic() - self.last_flush >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered row in one transaction. Statements the caller
+        ran on the same connection since the last commit (like job ledger
+        updates) are committed with them."""
+        if self.pending or self.conn.in_transaction:
+            start = time.perf_counter()
+            if not self.conn.in_transaction:
+                self.conn.execute('BEGIN')
+            try:
+                for (table_name, columns), rows in self.buffers.items():
+                    self.conn.executemany(insert_sql(table_name, columns), rows)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            METRICS.observe('db.flush', time.perf_counter() - start)
+            METRICS.count('db.rows_written', self.pending)
+
+        self.buffers = {}
+        self.pending = 0
+        self.last_flush = time.monotonic()
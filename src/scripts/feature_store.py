@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from windows import feature_columns
+
+FORMAT_VERSION = 1
+
+# Columns the notebooks leave unscaled (data.columns[:9] of the convert_pcts output)
+UNSCALED_COLUMNS = ['TEAM_ABBREVIATION', 'HOME_GAME']
+
+
+def version_dirs(root):
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(root) if name[:1] == 'v' and name[1:].isdigit())
+
+
+def write_feature_store(root, data, label='WL', group='TEAM_ABBREVIATION'):
+    """Writes the convert_pcts output to a new version under root.
+
+    1) Encodes `group` with a sorted vocabulary (what LabelEncoder does)
+    2) Sorts rows by team, keeping their order within a team, so each
+    team's games form one contiguous block
+    3) Standardizes the stat columns and keeps the mean and scale
+    4) Saves features, labels, dates, game ids and team offsets as .npy
+    files with the vocabulary and scaler in meta.json
+
+    The version is written to a temporary directory and renamed into place,
+    so readers never see a half written store. Returns the version number.
+    """
+    vocab = sorted(data[group].astype(str).unique())
+    codes = data[group].astype(str).map({abbr: i for i, abbr in enumerate(vocab)}).to_numpy()
+    order = np.argsort(codes, kind='stable')
+
+    df = data.iloc[order].copy()
+    df[group] = codes[order]
+    columns = feature_columns(df, label)
+
+    features = df[columns].to_numpy(dtype=np.float32)
+    scaled = np.array([col not in UNSCALED_COLUMNS for col in columns])
+    mean = np.where(scaled, features.mean(axis=0), 0).astype(np.float32)
+    scale = features.std(axis=0)
+    scale = np.where(scaled & (scale > 0), scale, 1).astype(np.float32)
+    features -= mean
+    features /= scale
+
+    offsets = np.searchsorted(df[group].to_numpy(), np.arange(len(vocab) + 1)).astype(np.int64)
+
+    versions = version_dirs(root)
+    version = versions[-1] + 1 if versions else 1
+    tmp_dir = os.path.join(root, '.v{}.tmp'.format(version))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, 'features.npy'), features)
+    np.save(os.path.join(tmp_dir, 'labels.npy'), df[label].to_numpy(dtype=np.float32))
+    np.save(os.path.join(tmp_dir, 'team_offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'game_dates.npy'), df['GAME_DATE'].to_numpy(dtype='datetime64[D]'))
+    np.save(os.path.join(tmp_dir, 'game_ids.npy'), df['GAME_ID'].to_numpy(dtype=str))
+    np.save(os.path.join(tmp_dir, 'seasons.npy'), df['SEASON'].to_numpy(dtype=str))
+
+    meta = {'format': FORMAT_VERSION, 'version': version, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rows': len(df), 'columns': columns, 'label': label, 'group': group, 'vocab': vocab,
+            'scaler': {'mean': mean.tolist(), 'scale': scale.tolist()}}
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    os.replace(tmp_dir, os.path.join(root, 'v{}'.format(version)))
+    return version
+
+
+def build_feature_store(conn, root, start_season, end_season):
+    """Runs the transform pipeline over the seasons and writes the result as a new version"""
+    from transform_db import transform
+
+    obj = transform(conn=conn, start_season=start_season, end_season=end_season)
+    data = obj.clean_team_data(obj.load_team_data())
+    data = data.dropna(subset='PCT_PTS_2PT')
+    data = obj.convert_pcts(data)
+
+    return write_feature_store(root, data)
+
+
+class feature_store:
+    """Read-only view of one version of a feature store.
+
+    Every array is opened with mmap_mode='r', so opening is instant and
+    processes that open the same version share the same pages.
+    """
+
+    def __init__(self, root, version=None):
+        versions = version_dirs(root)
+        if not versions:
+            raise FileNotFoundError('no feature store versions under {}'.format(root))
+        self.version = version or versions[-1]
+        self.path = os.path.join(root, 'v{}'.format(self.version))
+
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['format'] != FORMAT_VERSION:
+            raise ValueError('unsupported feature store format {}'.format(self.meta['format']))
+
+        self.columns = self.meta['columns']
+        self.vocab = self.meta['vocab']
+        self.mean = np.array(self.meta['scaler']['mean'], dtype=np.float32)
+        self.scale = np.array(self.meta['scaler']['scale'], dtype=np.float32)
+
+        self.features = self._load('features')
+        self.labels = self._load('labels')
+        self.team_offsets = self._load('team_offsets')
+        self.game_dates = self._load('game_dates')
+        self.game_ids = self._load('game_ids')
+        self.seasons = self._load('seasons')
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def team_rows(self, abbreviation):
+        """Slice of the rows that belong to one team"""
+        code = self.vocab.index(abbreviation)
+        return slice(int(self.team_offsets[code]), int(self.team_offsets[code + 1]))
+
+    def window_starts(self, window_size):
+        """Row index of the first game of every window that stays inside one team
+        and still has a following game to take its label from"""
+        rows = np.arange(len(self.features))
+        team_end = np.repeat(self.team_offsets[1:], np.diff(self.team_offsets))
+        return np.flatnonzero(rows + window_size < team_end)
+
+    def windows(self, window_size):
+        """Zero-copy (rows - window_size + 1, window_size, F) view of the features.
+        Only the rows listed by window_starts are valid windows."""
+        return sliding_window_view(self.features, window_size, axis=0).transpose(0, 2, 1)
@@ -0,0 +1,190 @@
+import datetime
+import importlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+import pandas as pd
+
+from metrics import METRICS
+
+
+class rate_limiter:
+    """Token bucket shared by every worker of a fetch_engine.
+
+    Tokens refill continuously at `rate` per second up to `burst`,
+    and each request takes one token, so the engine never goes
+    over `rate` requests per second however many workers it runs.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        start = time.perf_counter()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    METRICS.observe('fetch.rate_limit_wait', time.perf_counter() - start)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class fetch_engine:
+    """Runs endpoint calls on a bounded thread pool behind a shared rate limiter.
+
+    Every call is retried up to `retries` times with exponential backoff
+    and full jitter. `fn` can be any callable, so the engine can be
+    pointed at a local stub endpoint instead of stats.nba.com.
+    """
+
+    def __init__(self, max_workers=4, rate=2.0, burst=2, retries=4, backoff=1.0, max_backoff=30.0):
+        self.max_workers = max_workers
+        self.limiter = rate_limiter(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def call(self, fn, *args, metric=None, **kwargs):
+        """Calls fn(*args, **kwargs), retrying on any exception.
+        The last exception is re-raised once the retries run out.
+        Latencies and counts are recorded as fetch.<metric>, fn's name by default."""
+        name = 'fetch.' + (metric or getattr(fn, '__name__', 'call'))
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                # Latency of the failed attempt only, the backoff has its own histogram
+                METRICS.observe(name, time.perf_counter() - start)
+                METRICS.count(name + '.errors')
+                if attempt >= self.retries:
+                    METRICS.count(name + '.failures')
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                METRICS.count(name + '.retries')
+                METRICS.observe('fetch.backoff', delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            METRICS.observe(name, time.perf_counter() - start)
+            return result
+
+    def map(self, fn, keys, metric=None):
+        """Calls fn(key) for every key on the worker pool.
+        metric(key), when given, names the call's metrics (see call()).
+
+        Yields (key, result, error) tuples in completion order; error is
+        None on success and the final exception when every retry failed.
+        Results are yielded on the calling thread, so it is safe to write
+        them to a sqlite connection owned by the caller.
+
+        At most max_workers * 2 keys are queued at a time, and when the
+        caller stops early (break, an exception, Ctrl-C) the queued calls
+        are cancelled, so only the ones already running are waited for.
+        """
+        keys = iter(keys)
+        pending = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        def submit(n):
+            for key in islice(keys, n):
+                pending[pool.submit(self.call, fn, key, metric=metric(key) if metric else None)] = key
+
+        try:
+            submit(self.max_workers * 2)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future)
+                    try:
+                        result, error = future.result(), None
+                    except Exception as e:
+                        result, error = None, e
+                    yield key, result, error
+                    submit(1)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def season_finished(season_str):
+    """True once the season's playoffs are over (July 1st after it started)"""
+    return datetime.date.today() >= datetime.date(int(season_str[:4]) + 1, 7, 1)
+
+
+def data_frames(response):
+    """The DataFrames get_data_frames() would return, built from a get_dict() response"""
+    return [pd.DataFrame(result_set['rowSet'], columns=result_set['headers'])
+            for result_set in response['resultSets']]
+
+
+def check_response(response, result_set=0, require_rows=False):
+    """Raises ValueError unless response has result set number result_set,
+    with rows when require_rows is set"""
+    result_sets = response.get('resultSets') if isinstance(response, dict) else None
+    if not result_sets or len(result_sets) <= result_set:
+        raise ValueError('no result set {} in response: {}'.format(result_set, str(response)[:200]))
+    if require_rows and not result_sets[result_set].get('rowSet'):
+        raise ValueError('empty response')
+
+
+def request(endpoint, class_name, ttl=-1, cache=None, result_set=0, require_rows=False, **params):
+    """Calls class_name of the nba_api endpoint module (like leaguegamelog)
+    with params, through cache (a response_cache) when one is given, and
+    returns result set number result_set as a DataFrame. ttl=-1 uses the
+    cache's TTL for the endpoint and None never expires. nba_api is only
+    imported when a request goes to the network, so runs served from the
+    cache never load it. Every adapter below takes the cache to pass on as
+    its last argument.
+
+    The response is checked before it is cached: without the result set,
+    or with no rows when require_rows is set (a boxscore always has some),
+    it raises ValueError and nothing is stored, so a retry asks again."""
+    def call():
+        module = importlib.import_module('nba_api.stats.endpoints.' + endpoint)
+        return getattr(module, class_name)(**params).get_dict()
+
+    def validate(response):
+        check_response(response, result_set, require_rows)
+
+    if cache is None:
+        response = call()
+        validate(response)
+    else:
+        response = cache.fetch(endpoint, params, call, ttl, validate)
+    return data_frames(response)[result_set]
+
+
+def league_game_log(season_str, season_type='Regular Season', cache=None):
+    ttl = None if season_finished(season_str) else -1
+    return request('leaguegamelog', 'LeagueGameLog', ttl, cache, season=season_str,
+                   season_type_all_star=season_type)
+
+
+def advanced_boxscore(game_id, cache=None):
+    return request('boxscoreadvancedv2', 'BoxScoreAdvancedV2', cache=cache, result_set=1, require_rows=True,
+                   game_id=game_id)
+
+
+def scoring_boxscore(game_id, cache=None):
+    return request('boxscorescoringv2', 'BoxScoreScoringV2', cache=cache, result_set=1, require_rows=True,
+                   game_id=game_id)
+
+
+def player_game_logs(season_str, cache=None):
+    ttl = None if season_finished(season_str) else -1
+    return request('playergamelogs', 'PlayerGameLogs', ttl, cache, season_nullable=season_str,
+                   league_id_nullable='00')
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Seconds a cached response stays fresh, by endpoint. None never expires:
+# boxscores of finished games don't change. Game logs of a season that is
+# still being played go stale as soon as the next game is final.
+TTLS = {
+    'boxscoreadvancedv2': None,
+    'boxscorescoringv2': None,
+    'leaguegamelog': 10 * 60,
+    'playergamelogs': 10 * 60,
+}
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a request isn't in the cache"""
+
+
+def cache_key(endpoint, params):
+    """sha256 of the endpoint name and its parameters, independent of their order"""
+    blob = json.dumps([endpoint, sorted(params.items())], default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class response_cache:
+    """Content-addressed on-disk cache of raw nba_api responses.
+
+    Each response is stored as root/<key[:2]>/<key>.json, holding the
+    endpoint, its parameters, the fetch time and the response dict. A hit
+    touches the file's mtime, and once the files add up to more than
+    `max_bytes` the least recently used ones are deleted.
+
+    With offline=True nothing goes to the network: every cached response is
+    served regardless of its age and a miss raises CacheMiss, so a cache
+    directory can be used as a replay fixture.
+    """
+
+    def __init__(self, root, max_bytes=1 << 30, ttls=None, offline=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(root, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._files())
+
+    def _files(self):
+        for dir_name in os.listdir(self.root):
+            dir_path = os.path.join(self.root, dir_name)
+            if os.path.isdir(dir_path):
+                for name in os.listdir(dir_path):
+                    if name.endswith('.json'):
+                        yield os.path.join(dir_path, name)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def get(self, endpoint, params, ttl=-1):
+        """The cached response dict, or None if it is missing or older than ttl
+        (the endpoint's entry in self.ttls by default)"""
+        path = self._path(cache_key(endpoint, params))
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        ttl = self.ttls.get(endpoint) if ttl == -1 else ttl
+        if not self.offline and ttl is not None and time.time() - entry['fetched'] > ttl:
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['response']
+
+    def put(self, endpoint, params, response):
+        key = cache_key(endpoint, params)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Written under a unique name and renamed, so concurrent readers never see a partial file
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump({'endpoint': endpoint, 'params': params, 'fetched': time.time(), 'response': response},
+                      f, default=str)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += os.path.getsize(path) - old_size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Deletes least recently used files until the cache is back under 90% of max_bytes"""
+        files = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def fetch(self, endpoint, params, request, ttl=-1, validate=None):
+        """Returns the cached response for (endpoint, params), calling request()
+        and caching its result on a miss.
+
+        validate(response) raises ValueError for a response that must not be
+        cached (an error payload, an empty boxscore); it is called before put,
+        so the error reaches the caller and the next call asks again, and on a
+        hit, so a bad entry written before is treated as a miss.
+        """
+        response = self.get(endpoint, params, ttl)
+        if response is not None and validate is not None:
+            try:
+                validate(response)
+            except ValueError:
+                response = None
+        if response is not None:
+            self.hits += 1
+            return response
+        if self.offline:
+            raise CacheMiss('{} {}'.format(endpoint, params))
+
+        self.misses += 1
+        response = request()
+        if validate is not None:
+            validate(response)
+        self.put(endpoint, params, response)
+        return response
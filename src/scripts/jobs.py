@@ -0,0 +1,67 @@
+from schema import create_table
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class job_queue:
+    """Persistent ledger of (endpoint, GAME_ID) fetches in the ingest_jobs table.
+
+    Every game is enqueued as pending before it is fetched and marked done
+    or failed (with the attempt count and last error) afterwards.
+    mark_done and mark_failed don't commit: they are committed by the
+    batch_writer flush that writes the game's rows, so the ledger never
+    says done for rows that were lost in a crash.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        create_table(conn, 'ingest_jobs')
+
+    def enqueue(self, endpoint, season, game_ids, reset=False):
+        """Adds pending jobs. Existing jobs keep their status unless reset is True."""
+        conflict = "DO UPDATE SET STATUS = 'pending'" if reset else 'DO NOTHING'
+        self.conn.executemany(
+            '''INSERT INTO ingest_jobs (ENDPOINT, GAME_ID, SEASON, STATUS, ATTEMPTS, UPDATED_AT)
+            VALUES (?, ?, ?, 'pending', 0, datetime('now'))
+            ON CONFLICT (ENDPOINT, GAME_ID) {}'''.format(conflict),
+            [(endpoint, str(game_id), season) for game_id in game_ids])
+        self.conn.commit()
+
+    def game_ids(self, endpoint, statuses=(PENDING,), seasons=None):
+        sql = 'SELECT GAME_ID FROM ingest_jobs WHERE ENDPOINT = ? AND STATUS IN ({})'.format(
+            ', '.join(['?'] * len(statuses)))
+        params = [endpoint] + list(statuses)
+        if seasons is not None:
+            sql += ' AND SEASON IN ({})'.format(', '.join(['?'] * len(seasons)))
+            params += list(seasons)
+
+        return [row[0] for row in self.conn.execute(sql + ' ORDER BY GAME_ID', params)]
+
+    def mark_done(self, endpoint, game_id):
+        self.conn.execute('''UPDATE ingest_jobs SET STATUS = 'done', ATTEMPTS = ATTEMPTS + 1,
+            LAST_ERROR = NULL, UPDATED_AT = datetime('now') WHERE ENDPOINT = ? AND GAME_ID = ?''',
+            (endpoint, game_id))
+
+    def mark_failed(self, endpoint, game_id, error):
+        self.conn.execute('''UPDATE ingest_jobs SET STATUS = 'failed', ATTEMPTS = ATTEMPTS + 1,
+            LAST_ERROR = ?, UPDATED_AT = datetime('now') WHERE ENDPOINT = ? AND GAME_ID = ?''',
+            (repr(error), endpoint, game_id))
+
+    def clear(self, endpoint):
+        self.conn.execute('DELETE FROM ingest_jobs WHERE ENDPOINT = ?', (endpoint,))
+        self.conn.commit()
+
+    def failures(self, endpoint):
+        """(GAME_ID, ATTEMPTS, LAST_ERROR) for every failed job of endpoint"""
+        return self.conn.execute('''SELECT GAME_ID, ATTEMPTS, LAST_ERROR FROM ingest_jobs
+            WHERE ENDPOINT = ? AND STATUS = 'failed' ORDER BY GAME_ID''', (endpoint,)).fetchall()
+
+    def summary(self):
+        """{endpoint: {status: count}}"""
+        counts = {}
+        for endpoint, status, n in self.conn.execute(
+                'SELECT ENDPOINT, STATUS, count(*) FROM ingest_jobs GROUP BY ENDPOINT, STATUS'):
+            counts.setdefault(endpoint, {})[status] = n
+        return counts
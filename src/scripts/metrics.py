@@ -0,0 +1,149 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process in MiB, None where getrusage isn't available"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+class recorder:
+    """Collects stage timings, latency histograms and counters.
+
+    stage() times a block and records its duration, rows per second and
+    the process's peak RSS. observe() adds a latency to a histogram and
+    count() bumps a counter (like retries). With a path, every stage is
+    also appended to it as a JSON line as soon as it ends, and write()
+    appends the histograms and counters.
+
+    profile names a stage to run under cProfile (the stats are dumped next
+    to path as <stage>.prof), and trace_memory runs it under tracemalloc and
+    records its Python allocation peak and top allocation sites.
+    """
+
+    def __init__(self, path=None, profile=None, trace_memory=False):
+        self.path = path
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.lock = threading.Lock()
+        self.stages = []
+        self.histograms = {}
+        self.counters = {}
+
+    def _emit(self, event):
+        if self.path:
+            with self.lock, open(self.path, 'a') as f:
+                f.write(json.dumps(event, default=str) + '\n')
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """with METRICS.stage('transform.convert_pcts') as stage: ...; stage['rows'] = len(df)"""
+        record = {'event': 'stage', 'stage': name, **fields}
+        profiler = cProfile.Profile() if name == self.profile else None
+        tracing = self.trace_memory and name == self.profile and not tracemalloc.is_tracing()
+
+        if tracing:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(os.path.dirname(self.path or '.') or '.', name + '.prof'))
+            if tracing:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+                record['top_allocations'] = [str(stat) for stat in
+                                             tracemalloc.take_snapshot().statistics('lineno')[:10]]
+                tracemalloc.stop()
+
+            record['seconds'] = seconds
+            if record.get('rows') is not None and seconds > 0:
+                record['rows_per_s'] = record['rows'] / seconds
+            record['peak_rss_mb'] = peak_rss_mb()
+            record['time'] = time.time()
+            with self.lock:
+                self.stages.append(record)
+            self._emit(record)
+
+    def observe(self, name, seconds):
+        """Adds one latency to the histogram of name"""
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                                'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+            hist['count'] += 1
+            hist['sum'] += seconds
+            hist['max'] = max(hist['max'], seconds)
+            hist['buckets'][next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+                                 len(LATENCY_BUCKETS))] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """Stage totals, histograms with their bucket bounds, and counters"""
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record['stage'], {'calls': 0, 'seconds': 0.0, 'rows': 0})
+            total['calls'] += 1
+            total['seconds'] += record['seconds']
+            total['rows'] += record.get('rows') or 0
+        return {'stages': totals, 'histograms': self.histograms, 'counters': self.counters,
+                'bucket_bounds': LATENCY_BUCKETS, 'peak_rss_mb': peak_rss_mb()}
+
+    def write(self):
+        self._emit({'event': 'summary', 'time': time.time(), **self.summary()})
+
+
+# Recorder the pipeline reports to. It only keeps counts in memory until
+# configure() gives it a file to write to.
+METRICS = recorder()
+
+
+def configure(path=None, profile=None, trace_memory=False):
+    """Points METRICS at a JSON lines file, optionally profiling one stage"""
+    METRICS.path = path
+    METRICS.profile = profile
+    METRICS.trace_memory = trace_memory
+    return METRICS
+
+
+def instrument(name, rows=True):
+    """Decorator that runs a function as a METRICS stage. With rows, the
+    length of its result is recorded as the stage's row count."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.stage(name) as stage:
+                result = fn(*args, **kwargs)
+                if rows and hasattr(result, '__len__'):
+                    stage['rows'] = len(result)
+            return result
+        return wrapper
+    return decorator
@@ -1,20 +1,35 @@
-import keras
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import InputLayer, LSTM, Dense
-from tensorflow.keras.callbacks import ModelCheckpoint
-from tensorflow.keras.losses import MeanSquaredError
-from tensorflow.keras.metrics import RootMeanSquaredError, Accuracy
-from tensorflow.keras.optimizers import Adam
-from sklearn.model_selection import train_test_split
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+import json
+import os
 import re
-import sqlite3
+
+import numpy as np
+
+# keras, tensorflow and sklearn are imported in the methods that use them,
+# so loading a config or a feature store doesn't pay for them
+
+from feature_store import feature_store
+from metrics import instrument
 
 version_number = 1
 
+
+def scaler_path(model_path):
+    """Where the train-only scaler of the model at model_path is kept: a file
+    beside it, since the checkpoint rewrites the model directory"""
+    return os.path.normpath(model_path) + '.scaler.json'
+
+
+def load_scaler(model_path):
+    """(columns, shift, inv_scale) saved with the model at model_path,
+    or None when it was trained without fit_scaler"""
+    path = scaler_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        saved = json.load(f)
+    return (saved['columns'], np.array(saved['shift'], dtype=np.float32),
+            np.array(saved['inv_scale'], dtype=np.float32))
+
 class ModelConfig:
     def __init__(self, X, y, train_test_val_split):
         self.X = X
@@ -33,16 +48,231 @@ class ModelConfig:
         self.X_test = None
         self.y_test = None
 
+        # Sample positions of each split, set by split_positions
+        self.train_index = None
+        self.val_index = None
+        self.test_index = None
+
+        # Set when X is a feature store window view: sample i is X[index[i]]
+        self.index = None
+        self.store = None
+
+        # Set by fit_scaler: samples come out as (X - shift) * inv_scale
+        self.shift = None
+        self.inv_scale = None
+
+    @classmethod
+    def from_feature_store(cls, root, window_size, train_test_val_split, version=None):
+        """Opens a feature store version without copying it.
+        X is a strided view over the memory-mapped features and y holds
+        the label of the game that follows each window."""
+        store = feature_store(root, version)
+        index = store.window_starts(window_size)
+
+        config = cls(store.windows(window_size), store.labels[index + window_size], train_test_val_split)
+        config.index = index
+        config.store = store
+        config.data_shape = (len(index),) + config.X.shape[1:]
+
+        return config
+
+    def samples(self, positions):
+        """Windows for the given sample positions, gathered from X and
+        rescaled with the training statistics once fit_scaler has run"""
+        X = self.X[positions] if self.index is None else self.X[self.index[positions]]
+        if self.shift is not None:
+            X = (X - self.shift) * self.inv_scale
+        return X
+
+    def targets(self, by='date'):
+        """GAME_DATE (datetime64[D]) or SEASON of the game each sample predicts"""
+        if self.store is None:
+            raise ValueError('time based splits need a config from from_feature_store')
+        rows = self.index + self.data_shape[1]
+        return self.store.game_dates[rows] if by == 'date' else self.store.seasons[rows]
+
+    def _before(self, cutoff):
+        """Mask of the samples whose game is before cutoff, a 'YYYY-MM-DD' date or a '2019-20' season"""
+        if re.match(r'^\d{4}-\d{2}$', str(cutoff)):
+            return self.targets('season') < cutoff
+        return self.targets('date') < np.datetime64(cutoff, 'D')
+
+    def fit_scaler(self, positions):
+        """Standardizes every sample with the mean and standard deviation of
+        the games in the training windows at `positions` only.
+
+        The store features were standardized over all the data; since that
+        is affine, standardizing them again with the training rows' stats
+        gives what fitting the scaler on the raw training slice would, and
+        it is applied to each gathered batch so X is never copied.
+        Columns the store leaves unscaled stay as they are.
+        """
+        window_size = self.data_shape[1]
+        if self.index is None:
+            rows = self.X[positions].reshape(-1, self.data_shape[-1])
+        else:
+            starts = self.index[positions]
+            covered = np.zeros(len(self.store.features) + 1, dtype=np.int64)
+            np.add.at(covered, starts, 1)
+            np.add.at(covered, starts + window_size, -1)
+            rows = self.store.features[np.flatnonzero(np.cumsum(covered)[:-1] > 0)]
+
+        mean = rows.mean(axis=0, dtype=np.float64)
+        std = rows.std(axis=0, dtype=np.float64)
+        scaled = std > 0
+        if self.store is not None:
+            scaled &= self.store.scale != 1
+        self.shift = np.where(scaled, mean, 0).astype(np.float32)
+        self.inv_scale = np.where(scaled, 1 / np.where(scaled, std, 1), 1).astype(np.float32)
+        return self.shift, self.inv_scale
+
+    def time_split(self, train_end, val_end=None, fit_scaler=True):
+        """Splits the samples by the date (or season) of the game they predict:
+        train before train_end, val from train_end to val_end and test from
+        val_end on. Without val_end there is no val split and test starts at
+        train_end. Sets and returns (train, val, test) position arrays, and
+        fits the scaler on the training positions."""
+        train = self._before(train_end)
+        if val_end is None:
+            val = np.zeros_like(train)
+        else:
+            val = ~train & self._before(val_end)
+        self.train_index = np.flatnonzero(train)
+        self.val_index = np.flatnonzero(val)
+        self.test_index = np.flatnonzero(~train & ~val)
+
+        if fit_scaler:
+            self.fit_scaler(self.train_index)
+        return self.train_index, self.val_index, self.test_index
+
+    def walk_forward(self, cutoffs, fit_scaler=True):
+        """Yields (train, test) positions for each pair of consecutive cutoffs:
+        train is every game before cutoffs[k] and test the games from cutoffs[k]
+        up to cutoffs[k + 1]. The scaler is refit on each fold's training slice
+        before the fold is yielded."""
+        for start, end in zip(cutoffs[:-1], cutoffs[1:]):
+            train = np.flatnonzero(self._before(start))
+            test = np.flatnonzero(~self._before(start) & self._before(end))
+            if fit_scaler:
+                self.fit_scaler(train)
+            yield train, test
+
     def train_test_val(self):
+        from sklearn.model_selection import train_test_split
+
         train_ratio = self.train_test_val_split[0]
         test_ratio = self.train_test_val_split[1]
         val_ratio = self.train_test_val_split[2]
 
+        if self.index is not None:
+            # Split sample positions and only gather the windows each split needs
+            positions = np.arange(len(self.index))
+            train, temp = train_test_split(positions, test_size=1 - train_ratio)
+            val, test = train_test_split(temp, test_size=test_ratio/(test_ratio + val_ratio))
+
+            self.X_train, self.y_train = self.samples(train), self.y[train]
+            self.X_val, self.y_val = self.samples(val), self.y[val]
+            self.X_test, self.y_test = self.samples(test), self.y[test]
+            return
+
         self.X_train, X_test_temp, self.y_train, y_test_temp = train_test_split(self.X, self.y, test_size=1 - train_ratio)
         self.X_val, self.X_test, self.y_val, self.y_test = train_test_split(X_test_temp, y_test_temp, test_size=test_ratio/(test_ratio + val_ratio))
 
 
+    def split_positions(self, seed=None):
+        """Splits the sample positions by train_test_val_split without touching X.
+        Sets and returns (train, val, test) position arrays."""
+        train_ratio, test_ratio, _ = self.train_test_val_split
+        positions = np.random.default_rng(seed).permutation(self.data_shape[0])
+
+        n_train = int(round(len(positions) * train_ratio))
+        n_test = int(round(len(positions) * test_ratio))
+        self.train_index = positions[:n_train]
+        self.test_index = positions[n_train:n_train + n_test]
+        self.val_index = positions[n_train + n_test:]
+
+        return self.train_index, self.val_index, self.test_index
+
+    def _batch(self, batch):
+        """Windows and labels of one batch of sample positions, read from X.
+        For a feature store X is the window view over the memory-mapped
+        features, so only the batch's rows are read and nothing is copied
+        into memory up front."""
+        X = self.X[batch] if self.index is None else self.X[self.index[batch]]
+        return X.astype(np.float32, copy=False), np.asarray(self.y[batch], dtype=np.float32)
+
+    def dataset(self, positions, batch_size=32, shuffle=False, seed=None):
+        """tf.data pipeline over the given sample positions.
+
+        Only the positions go through the pipeline: they are shuffled and
+        batched, and each batch of windows is read from X (the memory-mapped
+        feature store rows) by _batch, parallel map calls overlapping their
+        reads, with the next batches prefetched while the model trains on
+        the current one.
+        The fit_scaler statistics in effect when the pipeline is built are
+        applied to every batch.
+        """
+        import tensorflow as tf
+
+        shape = [None] + list(self.data_shape[1:])
+        shift = None if self.shift is None else tf.constant(self.shift)
+        inv_scale = None if self.inv_scale is None else tf.constant(self.inv_scale)
+
+        ds = tf.data.Dataset.from_tensor_slices(np.asarray(positions, dtype=np.int64))
+        if shuffle:
+            ds = ds.shuffle(len(positions), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+        def gather(batch):
+            X, y = tf.numpy_function(self._batch, [batch], [tf.float32, tf.float32])
+            X.set_shape(shape)
+            y.set_shape([None])
+            if shift is not None:
+                X = (X - shift) * inv_scale
+            return X, y
+
+        ds = ds.map(gather, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+    def datasets(self, batch_size=32, seed=None):
+        """(train, val, test) pipelines over split_positions; only train is shuffled"""
+        if self.train_index is None:
+            self.split_positions(seed)
+        return (self.dataset(self.train_index, batch_size, shuffle=True, seed=seed),
+                self.dataset(self.val_index, batch_size),
+                self.dataset(self.test_index, batch_size))
+
+    @instrument('model.fit', rows=False)
+    def fit(self, epochs=None, batch_size=32, seed=None):
+        """Trains self.model on the train pipeline, validating on the val pipeline,
+        and keeps the best checkpoint in model_path when it is set"""
+        from tensorflow.keras.callbacks import ModelCheckpoint
+
+        train, val, _ = self.datasets(batch_size, seed)
+        callbacks = [ModelCheckpoint(self.model_path, save_best_only=True)] if self.model_path else []
+        history = self.model.fit(train, validation_data=val, epochs=epochs or self.epochs, callbacks=callbacks)
+        if self.model_path:
+            self.save_scaler(self.model_path)
+        return history
+
+    def save_scaler(self, model_path):
+        """Writes the train-only shift and inv_scale beside the model at
+        model_path, so the predictor scales its inputs the way training did.
+        Without them any file from an earlier run is removed."""
+        path = scaler_path(model_path)
+        if self.shift is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        columns = self.store.columns if self.store is not None else None
+        with open(path, 'w') as f:
+            json.dump({'columns': columns, 'shift': self.shift.tolist(),
+                       'inv_scale': self.inv_scale.tolist()}, f)
+
     def create_sequential(self):
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import InputLayer
+
         self.model = Sequential()
 
         input_shape = self.data_shape[1:]
@@ -55,6 +285,11 @@ class ModelConfig:
         version_str = f'v'
 
     def compile(self):
+        from tensorflow.keras.callbacks import ModelCheckpoint
+        from tensorflow.keras.losses import MeanSquaredError
+        from tensorflow.keras.metrics import RootMeanSquaredError
+        from tensorflow.keras.optimizers import Adam
+
         cp = ModelCheckpoint(self.model_path, save_best_only=True)
         self.model.compile(loss=MeanSquaredError(), optimizer=Adam(learning_rate=.00001), metrics=[RootMeanSquaredError()])
 
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+# tensorflow is imported when a predictor is built, so importing this module
+# (for MODEL_PATH or parse_games, say) doesn't load it
+
+from feature_store import feature_store
+from metrics import METRICS
+from model import load_scaler
+from team_form import team_form
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'model1')
+
+
+class predictor:
+    """Scores slates of upcoming games with a saved Keras model.
+
+    The model is loaded once and wrapped in a tf.function with a fixed
+    (None, window_size, F) float32 signature, so it is traced a single time
+    at warm-up and every later call runs the compiled graph.
+
+    A team's input window is its last window_size games from a team_form
+    state, put in the feature store's column order, with TEAM_ABBREVIATION
+    encoded through the store vocabulary and scaled with the store scaler,
+    which is how the training windows were built. When the model was
+    trained with ModelConfig.fit_scaler, the train-only scaler saved beside
+    it is applied on top.
+    """
+
+    def __init__(self, model_path, store, form):
+        import tensorflow as tf
+
+        self.store = store
+        self.form = form
+        self.window_size = form.window_size
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+
+        # Row of the form state that feeds each store column (-1 for the team code)
+        group = store.meta['group']
+        self.source = np.array([-1 if col == group else form.columns.index(col) for col in store.columns])
+        self.team_column = store.columns.index(group)
+
+        self.shift, self.inv_scale = None, None
+        scaler = load_scaler(model_path)
+        if scaler is not None:
+            columns, self.shift, self.inv_scale = scaler
+            if columns is not None and columns != store.columns:
+                raise ValueError('{} was trained on other store columns'.format(model_path))
+
+        signature = [tf.TensorSpec([None, self.window_size, len(store.columns)], tf.float32)]
+        self._score = tf.function(lambda X: self.model(X, training=False), input_signature=signature)
+        self._score(tf.zeros([1, self.window_size, len(store.columns)]))
+
+    @classmethod
+    def from_db(cls, conn, store_root, form_path, start_season, end_season, model_path=MODEL_PATH):
+        """Brings the team_form state at form_path up to date with the database and loads the model"""
+        store = feature_store(store_root)
+        if os.path.isdir(form_path):
+            form = team_form.load(form_path)
+        else:
+            form = team_form([col for col in store.columns if col != store.meta['group']])
+        form.update_from_db(conn, start_season, end_season)
+        form.save(form_path)
+        return cls(model_path, store, form)
+
+    def team_windows(self, teams):
+        """(len(teams), window_size, F) float32 model input, one window per team"""
+        X = np.empty((len(teams), self.window_size, len(self.source)), dtype=np.float32)
+        for i, team in enumerate(teams):
+            if team not in self.form.team_index or team not in self.store.vocab:
+                raise ValueError('unknown team {}'.format(team))
+            window = self.form.window(team)
+            X[i] = window[:, self.source]
+            X[i, :, self.team_column] = self.store.vocab.index(team)
+        X -= self.store.mean
+        X /= self.store.scale
+        if self.shift is not None:
+            X -= self.shift
+            X *= self.inv_scale
+        return X
+
+    def predict(self, games):
+        """Win probabilities for a slate of (home, away) games in one batched call.
+
+        Both teams' windows are scored, and the home team's probability is
+        the mean of its own prediction and one minus the away team's.
+        Returns a float32 array with one probability per game.
+        """
+        start = time.perf_counter()
+        teams = [team for game in games for team in game]
+        p = self._score(self.team_windows(teams)).numpy().reshape(-1, 2)
+        METRICS.observe('predict.batch', time.perf_counter() - start)
+        return (p[:, 0] + 1 - p[:, 1]) / 2
+
+    def predict_json(self, games):
+        start = time.perf_counter()
+        probs = self.predict(games)
+        return {'games': [{'home': home, 'away': away, 'home_win_prob': float(p)}
+                          for (home, away), p in zip(games, probs)],
+                'ms': round((time.perf_counter() - start) * 1000, 3)}
+
+
+def parse_games(values):
+    """['BOS:LAL', 'NYK:MIA'] (home:away) -> [('BOS', 'LAL'), ('NYK', 'MIA')]"""
+    games = [tuple(game.upper().split(':')) for value in values for game in value.split(',') if game]
+    for game in games:
+        if len(game) != 2:
+            raise ValueError('expected home:away, got {}'.format(':'.join(game)))
+    return games
+
+
+def serve(model, host='127.0.0.1', port=8000):
+    """GET /predict?games=BOS:LAL,NYK:MIA returns the predict_json output"""
+
+    class handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/predict':
+                self.send_error(404)
+                return
+            try:
+                body = model.predict_json(parse_games(parse_qs(url.query).get('games', [])))
+                status = 200
+            except ValueError as e:
+                body = {'error': str(e)}
+                status = 400
+
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    print('serving on http://{}:{}/predict'.format(host, port))
+    ThreadingHTTPServer((host, port), handler).serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Win probabilities for upcoming games')
+    parser.add_argument('games', nargs='*', help='home:away pairs, like BOS:LAL')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--store', required=True, help='feature store root')
+    parser.add_argument('--form', required=True, help='team_form state directory')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--seasons', nargs=2, type=int, default=[2013, 2023])
+    parser.add_argument('--serve', type=int, metavar='PORT')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    model = predictor.from_db(conn, args.store, args.form, *args.seasons, model_path=args.model)
+    if args.serve:
+        serve(model, port=args.serve)
+    else:
+        print(json.dumps(model.predict_json(parse_games(args.games)), indent=1))
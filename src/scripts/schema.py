@@ -0,0 +1,289 @@
+import re
+
+
+def _typed(names, sql_type):
+    return [(name, sql_type) for name in names.split()]
+
+
+_BASIC_STATS = _typed('''FGM FGA''', 'INTEGER') + [('FG_PCT', 'REAL')] + \
+    _typed('''FG3M FG3A''', 'INTEGER') + [('FG3_PCT', 'REAL')] + \
+    _typed('''FTM FTA''', 'INTEGER') + [('FT_PCT', 'REAL')] + \
+    _typed('''OREB DREB REB AST STL BLK TOV PF PTS PLUS_MINUS''', 'INTEGER')
+
+_PLAYER_RANKS = _typed('''GP_RANK W_RANK L_RANK W_PCT_RANK MIN_RANK FGM_RANK FGA_RANK FG_PCT_RANK
+    FG3M_RANK FG3A_RANK FG3_PCT_RANK FTM_RANK FTA_RANK FT_PCT_RANK OREB_RANK DREB_RANK REB_RANK
+    AST_RANK TOV_RANK STL_RANK BLK_RANK BLKA_RANK PF_RANK PFD_RANK PTS_RANK PLUS_MINUS_RANK
+    NBA_FANTASY_PTS_RANK DD2_RANK TD3_RANK''', 'INTEGER')
+
+# Every ingestion table is keyed on the game and the team (or player), so
+# writes go through INSERT ... ON CONFLICT DO UPDATE instead of rowid dedup scans
+TABLES = {
+    'team_basic_boxscores': {
+        'columns': [('SEASON', 'TEXT'), ('TEAM_ID', 'INTEGER'), ('TEAM_ABBREVIATION', 'TEXT'),
+                    ('TEAM_NAME', 'TEXT'), ('GAME_ID', 'TEXT'), ('GAME_DATE', 'TEXT'),
+                    ('MATCHUP', 'TEXT'), ('WL', 'TEXT'), ('MIN', 'INTEGER')] + _BASIC_STATS,
+        'primary_key': ('GAME_ID', 'TEAM_ID'),
+    },
+    'team_advanced_boxscores': {
+        'columns': [('GAME_ID', 'TEXT'), ('TEAM_ID', 'INTEGER'), ('TEAM_NAME', 'TEXT'),
+                    ('TEAM_ABBREVIATION', 'TEXT'), ('TEAM_CITY', 'TEXT'), ('MIN', 'TEXT')] +
+                   _typed('''E_OFF_RATING OFF_RATING E_DEF_RATING DEF_RATING E_NET_RATING NET_RATING
+                       AST_PCT AST_TOV AST_RATIO OREB_PCT DREB_PCT REB_PCT E_TM_TOV_PCT TM_TOV_PCT
+                       EFG_PCT TS_PCT USG_PCT E_USG_PCT E_PACE PACE PACE_PER40 POSS PIE''', 'REAL'),
+        'primary_key': ('GAME_ID', 'TEAM_ID'),
+    },
+    'team_scoring_boxscores': {
+        'columns': [('GAME_ID', 'TEXT'), ('TEAM_ID', 'INTEGER'), ('TEAM_NAME', 'TEXT'),
+                    ('TEAM_ABBREVIATION', 'TEXT'), ('TEAM_CITY', 'TEXT'), ('MIN', 'TEXT')] +
+                   _typed('''PCT_FGA_2PT PCT_FGA_3PT PCT_PTS_2PT PCT_PTS_2PT_MR PCT_PTS_3PT PCT_PTS_FB
+                       PCT_PTS_FT PCT_PTS_OFF_TOV PCT_PTS_PAINT PCT_AST_2PM PCT_UAST_2PM PCT_AST_3PM
+                       PCT_UAST_3PM PCT_AST_FGM PCT_UAST_FGM''', 'REAL'),
+        'primary_key': ('GAME_ID', 'TEAM_ID'),
+    },
+    'player_game_logs': {
+        'columns': [('SEASON_YEAR', 'TEXT'), ('PLAYER_ID', 'INTEGER'), ('PLAYER_NAME', 'TEXT'),
+                    ('NICKNAME', 'TEXT'), ('TEAM_ID', 'INTEGER'), ('TEAM_ABBREVIATION', 'TEXT'),
+                    ('TEAM_NAME', 'TEXT'), ('GAME_ID', 'TEXT'), ('GAME_DATE', 'TEXT'),
+                    ('MATCHUP', 'TEXT'), ('WL', 'TEXT'), ('MIN', 'REAL')] + _BASIC_STATS[:12] +
+                   _typed('''AST TOV STL BLK BLKA PF PFD PTS PLUS_MINUS''', 'INTEGER') +
+                   [('NBA_FANTASY_PTS', 'REAL'), ('DD2', 'INTEGER'), ('TD3', 'INTEGER')] +
+                   _PLAYER_RANKS +
+                   [('WNBA_FANTASY_PTS', 'REAL'), ('WNBA_FANTASY_PTS_RANK', 'INTEGER'),
+                    ('AVAILABLE_FLAG', 'INTEGER')],
+        'primary_key': ('GAME_ID', 'PLAYER_ID'),
+    },
+}
+
+# League ranks of each player game stat; they can be recomputed from the stats
+RANK_COLUMNS = [name for name, _ in TABLES['player_game_logs']['columns'] if name.endswith('_RANK')]
+
+# One row of the convert_pcts output; the boxscore table holds a home and an away copy
+MATCHUP_COLUMNS = [('SEASON', 'TEXT'), ('TEAM_ID', 'INTEGER'), ('TEAM_ABBREVIATION', 'TEXT'),
+                   ('TEAM_NAME', 'TEXT'), ('GAME_ID', 'TEXT'), ('GAME_DATE', 'TEXT'), ('MATCHUP', 'TEXT'),
+                   ('HOME_GAME', 'INTEGER'), ('WL', 'INTEGER')] + \
+    _typed('''FG2M FG2A FG3M FG3A FTM FTA OREB DREB REB AST STL BLK TOV PF PTS PLUS_MINUS''', 'INTEGER') + \
+    _typed('''E_OFF_RATING OFF_RATING E_DEF_RATING DEF_RATING E_NET_RATING NET_RATING POSS PIE''', 'REAL') + \
+    _typed('''PTS_2PT_MR PTS_FB PTS_OFF_TOV PTS_PAINT AST_2PM AST_3PM UAST_2PM UAST_3PM''', 'INTEGER')
+
+
+def _matchup_side(suffix):
+    return [(col + suffix, sql_type) for col, sql_type in MATCHUP_COLUMNS if col != 'GAME_ID']
+
+
+TABLES['boxscore'] = {
+    'columns': _matchup_side('_home')[:4] + [('GAME_ID', 'TEXT')] + _matchup_side('_home')[4:] +
+               _matchup_side('_away'),
+    'primary_key': ('GAME_ID',),
+}
+
+# Ledger of per-game endpoint calls, so an interrupted backfill can resume
+TABLES['ingest_jobs'] = {
+    'columns': [('ENDPOINT', 'TEXT'), ('GAME_ID', 'TEXT'), ('SEASON', 'TEXT'), ('STATUS', 'TEXT'),
+                ('ATTEMPTS', 'INTEGER'), ('LAST_ERROR', 'TEXT'), ('UPDATED_AT', 'TEXT')],
+    'primary_key': ('ENDPOINT', 'GAME_ID'),
+}
+
+
+# (table, columns) for the secondary indexes. GAME_ID lookups are served by the
+# primary keys; the SEASON indexes carry GAME_ID and TEAM_ID so the missing-game
+# anti-join in the update functions reads them without touching the table.
+INDEXES = [
+    ('team_basic_boxscores', ('SEASON', 'GAME_ID', 'TEAM_ID')),
+    ('team_basic_boxscores', ('GAME_DATE',)),
+    ('team_basic_boxscores', ('TEAM_ID', 'GAME_DATE')),
+    ('team_advanced_boxscores', ('TEAM_ID',)),
+    ('team_scoring_boxscores', ('TEAM_ID',)),
+    ('player_game_logs', ('SEASON_YEAR',)),
+    ('player_game_logs', ('GAME_DATE',)),
+    ('player_game_logs', ('TEAM_ID', 'GAME_DATE')),
+    ('player_game_logs', ('PLAYER_ID', 'GAME_DATE')),
+    ('boxscore', ('SEASON_home',)),
+    ('boxscore', ('GAME_DATE_home',)),
+    ('boxscore', ('TEAM_ID_home',)),
+    ('boxscore', ('TEAM_ID_away',)),
+    ('ingest_jobs', ('ENDPOINT', 'STATUS', 'SEASON')),
+]
+
+def missing_games_sql(table_names, n_dates=0, missing_only=True):
+    """(GAME_ID, TABLE_NAME) for every game of a season in team_basic_boxscores
+    that has no rows yet in one of table_names, in a single statement.
+    Takes the season, then n_dates 'YYYY-MM-DD' dates to restrict it to.
+    With missing_only=False every game is listed for every table, rows or not."""
+    # Numbered parameters, so every SELECT of the union binds the same values
+    dates = ' AND substr(b.GAME_DATE, 1, 10) IN ({})'.format(
+        ', '.join('?{}'.format(i + 2) for i in range(n_dates))) if n_dates else ''
+    missing = ' AND NOT EXISTS (SELECT 1 FROM {} x WHERE x.GAME_ID = b.GAME_ID)' if missing_only else ''
+    selects = ["SELECT DISTINCT b.GAME_ID, '{0}' AS TABLE_NAME FROM team_basic_boxscores b "
+               'WHERE b.SEASON = ?1{1}'.format(name, dates) + missing.format(name)
+               for name in table_names]
+    return '\nUNION ALL\n'.join(selects)
+
+# Only the columns transform.clean_team_data and convert_pcts use
+TEAM_DATA_COLUMNS = {
+    'b': ['SEASON', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_ID', 'GAME_DATE',
+          'MATCHUP', 'WL', 'FGM', 'FGA', 'FG3M', 'FG3A', 'FTM', 'FTA', 'OREB', 'DREB', 'REB',
+          'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'PLUS_MINUS'],
+    'a': ['E_OFF_RATING', 'OFF_RATING', 'E_DEF_RATING', 'DEF_RATING', 'E_NET_RATING',
+          'NET_RATING', 'POSS', 'PIE'],
+    's': ['PCT_PTS_2PT', 'PCT_PTS_2PT_MR', 'PCT_PTS_FB', 'PCT_PTS_OFF_TOV', 'PCT_PTS_PAINT',
+          'PCT_AST_2PM', 'PCT_AST_3PM', 'PCT_UAST_2PM', 'PCT_UAST_3PM'],
+}
+
+def team_data_sql(missing_from=None):
+    """Team data of a season range since a date. With missing_from (a table
+    keyed on GAME_ID) only the games that table doesn't have yet are read."""
+    missing = ' AND b.GAME_ID NOT IN (SELECT GAME_ID FROM {})'.format(missing_from) if missing_from else ''
+    return '''SELECT {} FROM team_basic_boxscores AS b
+    LEFT JOIN team_advanced_boxscores AS a ON a.GAME_ID = b.GAME_ID AND a.TEAM_ID = b.TEAM_ID
+    LEFT JOIN team_scoring_boxscores AS s ON s.GAME_ID = b.GAME_ID AND s.TEAM_ID = b.TEAM_ID
+    WHERE b.SEASON BETWEEN ? AND ? AND b.GAME_DATE >= ?{}
+    ORDER BY b.GAME_DATE, b.GAME_ID, b.TEAM_ID'''.format(
+        ', '.join('{}.{}'.format(alias, col) for alias, cols in TEAM_DATA_COLUMNS.items() for col in cols),
+        missing)
+
+TEAM_DATA_SQL = team_data_sql()
+
+# The read paths that have to stay on an index, with sample parameters
+HOT_QUERIES = {
+    'missing games in season': (
+        missing_games_sql(['team_advanced_boxscores', 'team_scoring_boxscores']), ('2023-24',)),
+    'team data by season range': (TEAM_DATA_SQL, ('2013-14', '2023-24', '')),
+    'team data since date': (TEAM_DATA_SQL, ('2013-14', '2023-24', '2024-01-01')),
+    'team data missing from boxscore': (team_data_sql('boxscore'), ('2013-14', '2023-24', '')),
+    'matchups by team': (
+        'SELECT * FROM boxscore WHERE TEAM_ID_home = ? OR TEAM_ID_away = ?', (1610612740, 1610612740)),
+}
+
+
+def column_names(table_name):
+    return [name for name, _ in TABLES[table_name]['columns']]
+
+
+def column_types(table_name):
+    """{column: SQL type} of a table"""
+    return dict(TABLES[table_name]['columns'])
+
+
+def create_table_sql(table_name):
+    table = TABLES[table_name]
+    columns = ['{} {}'.format(col, sql_type) for col, sql_type in table['columns']]
+    columns.append('PRIMARY KEY ({})'.format(', '.join(table['primary_key'])))
+    return 'CREATE TABLE IF NOT EXISTS {} (\n    {})'.format(table_name, ',\n    '.join(columns))
+
+
+def upsert_sql(table_name, columns, select_from=None):
+    """INSERT ... ON CONFLICT DO UPDATE for the given columns.
+    With select_from the rows come from that table instead of VALUES."""
+    key = TABLES[table_name]['primary_key']
+    updates = ['{0} = excluded.{0}'.format(col) for col in columns if col not in key]
+
+    if select_from is None:
+        source = 'VALUES ({})'.format(', '.join(['?'] * len(columns)))
+    else:
+        # WHERE true keeps sqlite from reading ON CONFLICT as part of a join
+        source = 'SELECT {} FROM {} WHERE true ORDER BY rowid'.format(', '.join(columns), select_from)
+
+    return 'INSERT INTO {} ({}) {} ON CONFLICT ({}) DO {}'.format(
+        table_name, ', '.join(columns), source, ', '.join(key),
+        'UPDATE SET ' + ', '.join(updates) if updates else 'NOTHING')
+
+
+def index_name(table_name, columns):
+    return 'ix_{}_{}'.format(table_name, '_'.join(columns)).lower()
+
+
+def create_indexes(conn, table_name=None):
+    """Creates the secondary indexes for table_name (or every table that exists)"""
+    for table, columns in INDEXES:
+        if table_name not in (None, table) or not table_columns(conn, table):
+            continue
+        conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+            index_name(table, columns), table, ', '.join(columns)))
+
+
+def query_plan_problems(conn, sql, params=()):
+    """Steps of the query plan that read a whole table instead of searching an index"""
+    # sqlite3 caches prepared statements and EXPLAIN isn't re-planned after an
+    # index changes, so tag the statement with the schema version
+    version = conn.execute('PRAGMA schema_version').fetchone()[0]
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN {} -- schema {}'.format(sql, version), params):
+        detail = row[-1]
+        if (detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail) or 'AUTOMATIC' in detail:
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(conn, queries=None):
+    """Raises if any hot query falls back to a full table scan.
+    Queries over tables that don't exist yet are skipped."""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    failures = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        tables = set(re.findall(r'(?:FROM|JOIN)\s+(\w+)', sql))
+        if not tables <= existing:
+            continue
+        problems = query_plan_problems(conn, sql, params)
+        if problems:
+            failures[name] = problems
+
+    if failures:
+        raise RuntimeError('full table scans in query plans: {}'.format(failures))
+
+
+def table_columns(conn, table_name):
+    """(name, pk position) for every column of an existing table"""
+    return [(row[1], row[5]) for row in conn.execute('PRAGMA table_info({})'.format(table_name))]
+
+
+def migrate_table(conn, table_name):
+    """Converts an untyped, unkeyed table to the typed schema in place.
+
+    Rows are copied in rowid order through the upsert, so when a
+    (GAME_ID, TEAM_ID) pair appears more than once the latest copy wins.
+    Columns the schema doesn't know about are dropped.
+    """
+    old_name = table_name + '_unkeyed'
+    known = set(column_names(table_name))
+    columns = [name for name, _ in table_columns(conn, table_name) if name in known]
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN')
+    try:
+        conn.execute('ALTER TABLE {} RENAME TO {}'.format(table_name, old_name))
+        conn.execute(create_table_sql(table_name))
+        conn.execute(upsert_sql(table_name, columns, select_from=old_name))
+        conn.execute('DROP TABLE {}'.format(old_name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def create_table(conn, table_name):
+    """Creates table_name with its typed schema, migrating an existing
+    table in place if it was created before the schema had keys"""
+    columns = table_columns(conn, table_name)
+    if columns and not any(pk for _, pk in columns):
+        migrate_table(conn, table_name)
+    else:
+        conn.execute(create_table_sql(table_name))
+    create_indexes(conn, table_name)
+
+
+def migrate(conn):
+    """Brings every known table in an existing database up to the typed schema"""
+    for table_name in TABLES:
+        if table_columns(conn, table_name):
+            create_table(conn, table_name)
+    create_indexes(conn)
+
+
+if __name__ == '__main__':
+    import sqlite3
+    import sys
+
+    conn = sqlite3.connect(sys.argv[1])
+    check_query_plans(conn)
+    print('all hot queries use an index')
@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from windows import ID_COLUMNS, feature_columns, partition
+
+
+class team_form:
+    """Rolling per-team aggregates of the convert_pcts columns.
+
+    For every team it keeps the game count, an exponentially weighted mean
+    and a ring buffer of the last `window_size` games, which mean() averages,
+    so it follows the team's current form instead of its whole history
+    across seasons. update() only touches the new games, so
+    appending a night of games costs O(new games), and mean(), ewma() and
+    window() read a team's state without looking at its history.
+
+    The state is saved to a directory with save() and read back with
+    team_form.load(), so a nightly job can pick up where the last one stopped.
+    """
+
+    def __init__(self, columns, window_size=10, alpha=0.1, group='TEAM_ABBREVIATION'):
+        self.columns = list(columns)
+        self.window_size = window_size
+        self.alpha = alpha
+        self.group = group
+
+        self.teams = []
+        self.team_index = {}
+        n_features = len(self.columns)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.ewmas = np.zeros((0, n_features), dtype=np.float64)
+        self.ring = np.zeros((0, window_size, n_features), dtype=np.float32)
+        # (GAME_DATE, GAME_ID) of each team's last game, so replayed rows are skipped
+        self.last_game = []
+
+    @classmethod
+    def from_data(cls, data, window_size=10, alpha=0.1, label='WL', group='TEAM_ABBREVIATION'):
+        """Engine over every numeric feature column of a convert_pcts output, filled with data"""
+        engine = cls(feature_columns(data, label, drop=ID_COLUMNS + [group]), window_size, alpha, group)
+        engine.update(data)
+        return engine
+
+    def _add_team(self, team):
+        self.team_index[team] = len(self.teams)
+        self.teams.append(team)
+        self.counts = np.append(self.counts, 0)
+        self.ewmas = np.vstack([self.ewmas, np.zeros((1, len(self.columns)))])
+        self.ring = np.concatenate([self.ring, np.zeros((1,) + self.ring.shape[1:], dtype=np.float32)])
+        self.last_game.append(('', ''))
+
+    def update(self, df):
+        """Folds the games in df (convert_pcts rows) into the state.
+        Rows at or before a team's last folded game are ignored, so the
+        same rows can be passed again safely. Returns the number of rows used."""
+        df = df.sort_values(['GAME_DATE', 'GAME_ID'], kind='stable')
+        dates = df['GAME_DATE'].astype(str).str[:10].to_numpy()
+        game_ids = df['GAME_ID'].astype(str).to_numpy()
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        teams = df[self.group].astype(str).to_numpy()
+
+        # Each team's rows, still in date order
+        order, offsets = partition(df, self.group)
+        used = 0
+        for lo, hi in zip(offsets[:-1], offsets[1:]):
+            rows = order[lo:hi]
+            team = teams[rows[0]]
+            if team not in self.team_index:
+                self._add_team(team)
+            t = self.team_index[team]
+
+            last_date, last_id = self.last_game[t]
+            rows = rows[(dates[rows] > last_date) | ((dates[rows] == last_date) & (game_ids[rows] > last_id))]
+            if len(rows) == 0:
+                continue
+
+            for row in values[rows]:
+                # The first game seeds the EWMA instead of being pulled towards zero
+                self.ewmas[t] = row if self.counts[t] == 0 else self.alpha * row + (1 - self.alpha) * self.ewmas[t]
+                self.ring[t, self.counts[t] % self.window_size] = row
+                self.counts[t] += 1
+            self.last_game[t] = (dates[rows[-1]], game_ids[rows[-1]])
+            used += len(rows)
+
+        return used
+
+    def update_from_db(self, conn, start_season, end_season):
+        """Loads and folds in only the games since the oldest team high-water mark"""
+        from transform_db import transform
+
+        since = min((date for date, _ in self.last_game), default='') or None
+        obj = transform(conn=conn, start_season=start_season, end_season=end_season)
+        data = obj.clean_team_data(obj.load_team_data(since=since))
+        data = data.dropna(subset='PCT_PTS_2PT')
+        return self.update(obj.convert_pcts(data))
+
+    def games(self, team):
+        return int(self.counts[self.team_index[team]])
+
+    def mean(self, team):
+        """Mean of the team's last window_size games (of all of them before it
+        has played that many), zeros before its first game"""
+        t = self.team_index[team]
+        played = min(self.counts[t], self.window_size)
+        if played == 0:
+            return np.zeros(len(self.columns))
+        return self.ring[t, :played].mean(axis=0, dtype=np.float64)
+
+    def ewma(self, team):
+        return self.ewmas[self.team_index[team]].copy()
+
+    def window(self, team):
+        """The team's last window_size games in the order they were played,
+        shape (window_size, F). Raises ValueError before it has played that many."""
+        t = self.team_index[team]
+        count = self.counts[t]
+        if count < self.window_size:
+            raise ValueError('{} has played {} games, fewer than the window size {}'.format(
+                team, count, self.window_size))
+        start = count % self.window_size
+        return np.concatenate([self.ring[t, start:], self.ring[t, :start]])
+
+    def matchup_vector(self, home, away):
+        """Pre-game features of a matchup: the home team's mean and EWMA, then the away team's"""
+        return np.concatenate([self.mean(home), self.ewma(home), self.mean(away), self.ewma(away)])
+
+    def save(self, path):
+        """Writes the state to path, replacing what was there"""
+        tmp_path = path.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        np.savez(os.path.join(tmp_path, 'state.npz'), counts=self.counts, ewmas=self.ewmas, ring=self.ring)
+        meta = {'columns': self.columns, 'window_size': self.window_size, 'alpha': self.alpha,
+                'group': self.group, 'teams': self.teams, 'last_game': self.last_game}
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        engine = cls(meta['columns'], meta['window_size'], meta['alpha'], meta['group'])
+        engine.teams = meta['teams']
+        engine.team_index = {team: i for i, team in enumerate(engine.teams)}
+        engine.last_game = [tuple(game) for game in meta['last_game']]
+
+        with np.load(os.path.join(path, 'state.npz')) as state:
+            engine.counts = state['counts']
+            engine.ewmas = state['ewmas']
+            engine.ring = state['ring']
+        return engine
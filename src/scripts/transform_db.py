@@ -2,12 +2,148 @@ import sqlite3
 import pandas as pd
 import numpy as np
 import warnings
+import json
+import os
 import sqlite3
+from operator import itemgetter
 from sqlite3 import Error
 
+from metrics import instrument
+from schema import TABLES, team_data_sql, RANK_COLUMNS, column_names, column_types
+
+# Relocated franchises -> their most recent abbreviation
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'franchise_abbreviations.json')) as f:
+    FRANCHISE_ABBREVIATIONS = json.load(f)
+
 def season_string(season):
     return str(season) + '-' + str(season+1)[-2:]
 
+
+def _dtypes(names, dtype):
+    return {name: dtype for name in names.split()}
+
+
+# Column types for the team data, applied as soon as it is loaded.
+# Integer types are the smallest that hold every real value; cast_column
+# widens them (with a warning) instead of letting a value wrap around.
+COLUMN_DTYPES = {
+    **_dtypes('SEASON TEAM_ABBREVIATION TEAM_NAME MATCHUP', 'category'),
+    'TEAM_ID': 'int32',
+    **_dtypes('''FGM FG2M FG3M FG3A FTM FTA OREB DREB REB AST STL BLK TOV PF PLUS_MINUS
+        PTS_2PT_MR PTS_FB PTS_OFF_TOV PTS_PAINT AST_2PM AST_3PM UAST_2PM UAST_3PM''', 'int8'),
+    **_dtypes('FGA FG2A PTS', 'int16'),
+    **_dtypes('''E_OFF_RATING OFF_RATING E_DEF_RATING DEF_RATING E_NET_RATING NET_RATING POSS PIE
+        PCT_PTS_2PT PCT_PTS_2PT_MR PCT_PTS_FB PCT_PTS_OFF_TOV PCT_PTS_PAINT
+        PCT_AST_2PM PCT_AST_3PM PCT_UAST_2PM PCT_UAST_3PM''', 'float32'),
+}
+
+# Column types of the player_game_logs chunks; the id columns are read as text
+PLAYER_DTYPES = {
+    **_dtypes('SEASON_YEAR PLAYER_NAME NICKNAME TEAM_ABBREVIATION TEAM_NAME MATCHUP WL', 'category'),
+    **_dtypes('''FGM FGA FG3M FG3A FTM FTA OREB DREB REB AST TOV STL BLK BLKA PF PFD PTS PLUS_MINUS
+        DD2 TD3 AVAILABLE_FLAG''', 'int8'),
+    **_dtypes('MIN FG_PCT FG3_PCT FT_PCT NBA_FANTASY_PTS WNBA_FANTASY_PTS', 'float32'),
+    **{name: 'int16' for name in RANK_COLUMNS},
+}
+
+# SQL types of the player_game_logs reads, which CAST the id columns to TEXT
+PLAYER_ID_COLUMNS = ['TEAM_ID', 'GAME_ID', 'PLAYER_ID']
+PLAYER_TYPES = {**column_types('player_game_logs'), **{name: 'TEXT' for name in PLAYER_ID_COLUMNS}}
+
+_INT_TYPES = ['int8', 'int16', 'int32', 'int64']
+
+
+def cast_column(series, dtype):
+    """Casts series to dtype. Integer casts are range checked: a column
+    with values that don't fit is widened to the next integer type that
+    does, and a column with missing values becomes float32.
+    Floats cast to an integer type are truncated, like astype."""
+    if dtype not in _INT_TYPES or len(series) == 0:
+        return series.astype(dtype)
+    if series.isna().any():
+        return series.astype('float32')
+
+    low, high = series.min(), series.max()
+    for candidate in _INT_TYPES[_INT_TYPES.index(dtype):]:
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            if candidate != dtype:
+                warnings.warn('{} has values in [{}, {}], stored as {} instead of {}'.format(
+                    series.name, low, high, candidate, dtype))
+            return series.astype(candidate)
+
+    raise OverflowError('{} has values in [{}, {}] that do not fit in int64'.format(series.name, low, high))
+
+
+def _from_category_values(codes, values):
+    """Categorical column whose row i is values[codes[i]], with its categories
+    sorted as astype('category') would sort them; code -1 stays missing"""
+    value_codes, uniques = pd.factorize(values, sort=True)
+    row_codes = np.where(codes >= 0, value_codes[codes], -1)
+    return pd.Categorical.from_codes(row_codes, uniques)
+
+
+def normalize_matchups(df, mapping=FRANCHISE_ABBREVIATIONS):
+    """Parses MATCHUP ('LAL vs. BOS' or 'LAL @ BOS') into TEAM_ABBREVIATION,
+    OPP_ABBREVIATION and HOME_GAME, mapping relocated franchises through
+    `mapping`. The parsing and the mapping run once per distinct value
+    and are spread to the rows through the categorical codes."""
+    matchup = df['MATCHUP'].astype('category')
+    codes = matchup.cat.codes.to_numpy()
+    parts = matchup.cat.categories.to_series().str.extract(r'^(\w+) (vs\.|@) (\w+)$')
+
+    team = parts[0].replace(mapping)
+    opp = parts[2].replace(mapping)
+    home = (parts[1] == 'vs.').to_numpy(dtype='int8')
+
+    team_abbr = df['TEAM_ABBREVIATION'].astype('category')
+    team_abbr_values = team_abbr.cat.categories.to_series().replace(mapping)
+
+    df['TEAM_ABBREVIATION'] = _from_category_values(team_abbr.cat.codes.to_numpy(), team_abbr_values.to_numpy())
+    df['OPP_ABBREVIATION'] = _from_category_values(codes, opp.to_numpy())
+    df['MATCHUP'] = _from_category_values(codes, (team + ' ' + parts[1] + ' ' + opp).to_numpy())
+    df['HOME_GAME'] = np.where(codes >= 0, home[codes], 0).astype('int8')
+
+    return df
+
+
+def _column(rows, i, sql_type):
+    """Column i of the fetched rows as one array, typed by its SQL type.
+    INTEGER columns come back as int64 and REAL as float64; a column with
+    NULLs (or non integral values in an INTEGER column) is float64 with NaN.
+    Columns with no known type, or values that aren't numbers, are left
+    to pandas to infer."""
+    if sql_type in ('INTEGER', 'REAL'):
+        try:
+            # NULL is read as NaN
+            values = np.fromiter(map(itemgetter(i), rows), np.float64, count=len(rows))
+        except (TypeError, ValueError):
+            sql_type = None
+        else:
+            if sql_type == 'INTEGER' and not np.isnan(values).any():
+                ints = values.astype(np.int64)
+                if (ints == values).all():
+                    return ints
+            return values
+    if sql_type == 'TEXT':
+        return np.fromiter(map(itemgetter(i), rows), object, count=len(rows))
+    return pd.Series([row[i] for row in rows]).to_numpy()
+
+
+def _frame(rows, names, types):
+    """DataFrame of fetched rows, built one typed column at a time"""
+    frame = pd.DataFrame({i: _column(rows, i, types.get(name)) for i, name in enumerate(names)})
+    frame.columns = names
+    return frame
+
+
+def apply_dtypes(df, dtypes=COLUMN_DTYPES):
+    """Casts every column of df that has a declared type"""
+    for col in df.columns:
+        if col in dtypes:
+            df[col] = cast_column(df[col], dtypes[col])
+    return df
+
 class transform:
 
     def __init__(self,conn,start_season,end_season):
@@ -16,95 +152,86 @@ class transform:
         self.end_season = end_season
 
 
-    def load_team_data(self):
+    @instrument('transform.load_team_data')
+    def load_team_data(self, since=None, missing_from=None):
         """Loads basic, advanced, and scoring boxscores 
-        from sqlite database and merges them into one dataframe"""
-
-        basic = pd.read_sql("SELECT * FROM team_basic_boxscores", self.conn)
-        adv = pd.read_sql("SELECT * FROM team_advanced_boxscores", self.conn)
-        scoring = pd.read_sql("SELECT * FROM team_scoring_boxscores", self.conn)
-
-
-        temp = pd.merge(basic, adv, how='left', on=[
-                        'GAME_ID', 'TEAM_ID'], suffixes=['', '_y'])
-        df = pd.merge(temp, scoring, how='left', on=[
-                      'GAME_ID', 'TEAM_ID'], suffixes=['', '_y'])
+        from sqlite database and merges them into one dataframe.
+        The join and the season filter run in sqlite, and only the
+        columns the later transform steps keep are read, and each
+        column gets its COLUMN_DTYPES type.
+        With since ('YYYY-MM-DD') only games on or after that date are loaded,
+        and with missing_from only games that table (like boxscore) doesn't have."""
 
+        df = pd.read_sql(team_data_sql(missing_from), self.conn,
+                         params=(season_string(self.start_season), season_string(self.end_season), since or ''))
+        df = apply_dtypes(df)
 
-        df = df.loc[df['SEASON'].between(season_string(self.start_season), season_string(self.end_season))]
-
-    
         return df
     
+    @instrument('transform.create_matchups')
     def create_matchups(self, df):
         """This function makes each row a matchup between 
-        team and opp"""
-        df2 = df.copy()
+        the home team and the away team (one row per game).
+        Home and away rows are split on HOME_GAME once and
+        aligned on GAME_ID, so no self-pairs are ever built."""
+        home = df.loc[df['HOME_GAME'] == 1]
+        away = df.loc[df['HOME_GAME'] == 0]
 
-        matchups = pd.merge(df, df2, on=['GAME_ID'], suffixes=['_home', '_away'], copy=False, how="left")
-        matchups = matchups.loc[matchups['TEAM_ABBREVIATION_home'] != matchups['TEAM_ABBREVIATION_away']]
+        home = home.rename(columns=lambda col: col if col == 'GAME_ID' else col + '_home')
+        away = away.rename(columns=lambda col: col if col == 'GAME_ID' else col + '_away')
+
+        matchups = pd.merge(home, away, on='GAME_ID', how='inner', validate='one_to_one')
 
         return matchups
     
+    @instrument('transform.clean_team_data')
     def clean_team_data(self, df):
         """This function cleans the team_data
         1) Changes W/L to 1/0 
         2) Changes franchise abbreviations to their most 
-        recent abbreviation for consistency
+        recent abbreviation for consistency (FRANCHISE_ABBREVIATIONS)
+        and creates the binary column 'HOME_GAME' and the
+        column 'OPP_ABBREVIATION' from one parse of MATCHUP
         3) Converts GAME_DATE to datetime object
-        4) Creates a binary column 'HOME_GAME'
-        5) Removes 3 games where advanced stats were not collected
+        4) Removes 3 games where advanced stats were not collected
         """
         df = df.copy()
-        df['WL'] = (df['WL'] == 'W').astype(int)
-
-        abbr_mapping = {'NJN': 'BKN',
-                        'CHH': 'CHA',
-                        'VAN': 'MEM',
-                        'NOH': 'NOP',
-                        'NOK': 'NOP',
-                        'SEA': 'OKC'}
-
-        df['TEAM_ABBREVIATION'] = df['TEAM_ABBREVIATION'].replace(abbr_mapping)
-        df['MATCHUP'] = df['MATCHUP'].str.replace('NJN', 'BKN')
-        df['MATCHUP'] = df['MATCHUP'].str.replace('CHH', 'CHA')
-        df['MATCHUP'] = df['MATCHUP'].str.replace('VAN', 'MEM')
-        df['MATCHUP'] = df['MATCHUP'].str.replace('NOH', 'NOP')
-        df['MATCHUP'] = df['MATCHUP'].str.replace('NOK', 'NOP')
-        df['MATCHUP'] = df['MATCHUP'].str.replace('SEA', 'OKC')
+        df['WL'] = (df['WL'] == 'W').astype('int8')
 
-        df['GAME_DATE'] = pd.to_datetime(df['GAME_DATE'])
+        df = normalize_matchups(df)
 
-        df['HOME_GAME'] = df['MATCHUP'].str.contains('vs').astype(int)
+        df['GAME_DATE'] = pd.to_datetime(df['GAME_DATE'])
 
         df.dropna(inplace=True)
 
         return df
     
+    @instrument('transform.convert_pcts')
     def convert_pcts(self,df):
         """This function...
         1) Removes categories that are percentages,
         as we will be averaging them and do not want to average 
         percentages. 
-        2) Converts shooting percentage stats into raw values"""
+        2) Converts shooting percentage stats into raw values,
+        range checked into their COLUMN_DTYPES types"""
         df = df.copy()
 
         df = df.drop(columns=['FT_PCT', 'FG_PCT', 'FG3_PCT', 'DREB_PCT',
                               'OREB_PCT', 'REB_PCT', 'AST_PCT', 'AST_TOV',
                               'AST_RATIO', 'E_TM_TOV_PCT', 'TM_TOV_PCT',
                               'EFG_PCT', 'TS_PCT', 'USG_PCT', 'E_USG_PCT',
-                              'PACE', 'PACE_PER40', 'MIN'])
+                              'PACE', 'PACE_PER40', 'MIN'], errors='ignore')
 
-        df['FG2M'] = df['FGM'] - df['FG3M']
-        df['FG2A'] = df['FGA'] - df['FG3A']
-        df['PTS_2PT_MR'] = (df['PTS'] * df['PCT_PTS_2PT_MR']).astype('int8')
-        df['PTS_FB'] = (df['PTS'] * df['PCT_PTS_FB']).astype('int8')
-        df['PTS_OFF_TOV'] = (df['PTS'] * df['PCT_PTS_OFF_TOV']).astype('int8')
-        df['PTS_PAINT'] = (df['PTS'] * df['PCT_PTS_PAINT']).astype('int8')
-        df['AST_2PM'] = (df['FG2M'] * df['PCT_AST_2PM']).astype('int8')
-        df['AST_3PM'] = (df['FG3M'] * df['PCT_AST_3PM']).astype('int8')
-        df['UAST_2PM'] = (df['FG2M'] * df['PCT_UAST_2PM']).astype('int8')
-        df['UAST_3PM'] = (df['FG3M'] * df['PCT_UAST_3PM']).astype('int8')
+        df['FG2M'] = cast_column(df['FGM'] - df['FG3M'], COLUMN_DTYPES['FG2M'])
+        df['FG2A'] = cast_column(df['FGA'] - df['FG3A'], COLUMN_DTYPES['FG2A'])
+        df['PTS_2PT_MR'] = cast_column(df['PTS'] * df['PCT_PTS_2PT_MR'], COLUMN_DTYPES['PTS_2PT_MR'])
+        df['PTS_FB'] = cast_column(df['PTS'] * df['PCT_PTS_FB'], COLUMN_DTYPES['PTS_FB'])
+        df['PTS_OFF_TOV'] = cast_column(df['PTS'] * df['PCT_PTS_OFF_TOV'], COLUMN_DTYPES['PTS_OFF_TOV'])
+        df['PTS_PAINT'] = cast_column(df['PTS'] * df['PCT_PTS_PAINT'], COLUMN_DTYPES['PTS_PAINT'])
+        df['AST_2PM'] = cast_column(df['FG2M'] * df['PCT_AST_2PM'], COLUMN_DTYPES['AST_2PM'])
+        df['AST_3PM'] = cast_column(df['FG3M'] * df['PCT_AST_3PM'], COLUMN_DTYPES['AST_3PM'])
+        df['UAST_2PM'] = cast_column(df['FG2M'] * df['PCT_UAST_2PM'], COLUMN_DTYPES['UAST_2PM'])
+        df['UAST_3PM'] = cast_column(df['FG3M'] * df['PCT_UAST_3PM'], COLUMN_DTYPES['UAST_3PM'])
 
 
         df = df[['SEASON', 'TEAM_ID', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_ID',
@@ -137,102 +264,55 @@ class load_clean:
 
         return conn, cur
     
-    def basic_boxscores(self):
-        self.cur.execute("SELECT * FROM team_basic_boxscores")
-        rows = self.cur.fetchall()
-
-        db_list = []
-
-        for row in rows:
-            db_list.append(row)
-
-        basic_boxscores = pd.DataFrame(data=db_list)
+    def _chunks(self, sql, params, chunksize, types):
+        """Column names from cursor.description and a generator of the result's chunks"""
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        names = [d[0] for d in cur.description]
+
+        def chunks():
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield _frame(rows, names, types or {})
+
+        return names, chunks()
+
+    def iter_query(self, sql, params=(), chunksize=50000, types=None):
+        """Runs sql and yields DataFrames of at most chunksize rows.
+        Column names come from cursor.description, and each column of a
+        chunk is read straight into one array typed by `types`
+        ({column: SQL type}, like schema.column_types gives)."""
+        return self._chunks(sql, params, chunksize, types)[1]
+
+    @instrument('load_clean.query')
+    def query(self, sql, params=(), chunksize=50000, types=None):
+        """Runs sql and returns the whole result as one DataFrame"""
+        names, chunks = self._chunks(sql, params, chunksize, types)
+        chunks = list(chunks)
+        if not chunks:
+            return pd.DataFrame(columns=names)
+        if len(chunks) == 1:
+            return chunks[0]
+        return pd.concat(chunks, ignore_index=True)
+
+    def iter_table(self, table_name, chunksize=50000):
+        """Streams a whole table in chunks, for tables that don't fit comfortably in RAM"""
+        return self.iter_query("SELECT * FROM {}".format(table_name), chunksize=chunksize,
+                               types=column_types(table_name) if table_name in TABLES else None)
 
-        basic_boxscores.columns = ['SEASON', 'TEAM_ID', 'TEAM_ABBREVIATION', 
-                    'TEAM_NAME', 'GAME_ID', 'GAME_DATE', 'MATCHUP', 'WL', 'MIN', 'FGM', 'FGA', 
-                    'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT', 'OREB',
-                    'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 
-                    'PLUS_MINUS']
-        
-        return basic_boxscores
+    def basic_boxscores(self):
+        return self.query("SELECT * FROM team_basic_boxscores", types=column_types('team_basic_boxscores'))
     
     def advanced_boxscores(self):
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM team_advanced_boxscores")
-        rows = cur.fetchall()
-
-        db_advanced_list = []
-
-        for row in rows:
-            db_advanced_list.append(row)
-
-        advanced_boxscores = pd.DataFrame(data=db_advanced_list)
-
-        advanced_boxscores.columns = ['GAME_ID', 'TEAM_ID', 'TEAM_NAME', 
-                    'TEAM_ABBREVIATION', 'TEAM_CITY', 'MIN', 'E_OFF_RATING', 'OFF_RATING', 'E_DEF_RATING', 
-                    'DEF_RATING', 'E_NET_RATING', 'NET_RATING', 'AST_PCT', 'AST_TOV', 
-                    'AST_RATIO', 'OREB_PCT', 'DREB_PCT', 'REB_PCT', 'E_TM_TOV_PCT', 
-                    'TM_TOV_PCT', 'EFG_PCT', 'TS_PCT', 'USG_PCT', 'E_USG_PCT', 'E_PACE', 
-                    'PACE', 'PACE_PER40', 'POSS', 'PIE']
-        
-        return advanced_boxscores
+        return self.query("SELECT * FROM team_advanced_boxscores", types=column_types('team_advanced_boxscores'))
     
     def scoring_boxscores(self):
-        self.cur.execute("SELECT * FROM team_scoring_boxscores")
-        rows = self.cur.fetchall()
-
-        db_scoring_list = []
-
-        for row in rows:
-            db_scoring_list.append(row)
-
-        scoring_boxscores = pd.DataFrame(data=db_scoring_list)
-
-        scoring_boxscores.columns = ['GAME_ID', 'TEAM_ID', 'TEAM_NAME', 'TEAM_ABBREVIATION', 'TEAM_CITY',
-               'MIN', 'PCT_FGA_2PT', 'PCT_FGA_3PT', 'PCT_PTS_2PT', 'PCT_PTS_2PT_MR',
-               'PCT_PTS_3PT', 'PCT_PTS_FB', 'PCT_PTS_FT', 'PCT_PTS_OFF_TOV',
-               'PCT_PTS_PAINT', 'PCT_AST_2PM', 'PCT_UAST_2PM', 'PCT_AST_3PM',
-               'PCT_UAST_3PM', 'PCT_AST_FGM', 'PCT_UAST_FGM']
-
-        return scoring_boxscores
+        return self.query("SELECT * FROM team_scoring_boxscores", types=column_types('team_scoring_boxscores'))
     
     def boxscore_matchups(self):
-        self.cur.execute("SELECT * FROM boxscores")
-        rows3 = self.cur.fetchall()
-
-        boxscores_list = []
-
-        columns = ['SEASON_home', 'TEAM_ID_home', 'TEAM_ABBREVIATION_home',
-                'TEAM_NAME_home', 'GAME_ID', 'GAME_DATE_home', 'MATCHUP_home',
-                'HOME_GAME_home', 'WL_home',
-                'FG2M_home', 'FG2A_home', 'FG3M_home', 'FG3A_home',
-                'FTM_home', 'FTA_home', 'OREB_home', 'DREB_home', 'REB_home',
-                'AST_home', 'STL_home', 'BLK_home', 'TOV_home', 'PF_home', 'PTS_home',
-                'PLUS_MINUS_home', 'E_OFF_RATING_home', 'OFF_RATING_home',
-                'E_DEF_RATING_home', 'DEF_RATING_home', 'E_NET_RATING_home',
-                'NET_RATING_home', 'POSS_home', 'PIE_home', 'PTS_2PT_MR_home',
-                'PTS_FB_home', 'PTS_OFF_TOV_home', 'PTS_PAINT_home', 'AST_2PM_home',
-                'AST_3PM_home', 'UAST_2PM_home', 'UAST_3PM_home', 'SEASON_away',
-                'TEAM_ID_away', 'TEAM_ABBREVIATION_away', 'TEAM_NAME_away', 'GAME_DATE_away', 
-                'MATCHUP_away', 'HOME_GAME_away','WL_away', 
-                'FG2M_away', 'FG2A_away',
-                'FG3M_away', 'FG3A_away', 'FTM_away', 'FTA_away', 'OREB_away', 'DREB_away', 
-                'REB_away', 'AST_away', 'STL_away', 'BLK_away', 
-                'TOV_away', 'PF_away', 'PTS_away', 'PLUS_MINUS_away', 'E_OFF_RATING_away', 
-                'OFF_RATING_away',
-                'E_DEF_RATING_away', 'DEF_RATING_away', 'E_NET_RATING_away', 
-                'NET_RATING_away', 'POSS_away', 'PIE_away', 'PTS_2PT_MR_away', 'PTS_FB_away',
-                'PTS_OFF_TOV_away', 'PTS_PAINT_away', 'AST_2PM_away', 'AST_3PM_away', 
-                'UAST_2PM_away', 'UAST_3PM_away']
-
-        for row in rows3:
-            boxscores_list.append(row)
-
-        boxscores = pd.DataFrame(data=boxscores_list)
-
-        boxscores.columns = columns
-
-        boxscores_clean = boxscores[['GAME_ID','TEAM_ID_home','TEAM_ID_away','SEASON_home','GAME_DATE_home',
+        columns = ['GAME_ID','TEAM_ID_home','TEAM_ID_away','SEASON_home','GAME_DATE_home',
                 'TEAM_NAME_home','TEAM_NAME_away', 'MATCHUP_home','TEAM_ABBREVIATION_home',
                 'HOME_GAME_home', 'WL_home',
                 'FG2M_home', 'FG2A_home', 'FG3M_home', 'FG3A_home',
@@ -252,66 +332,51 @@ class load_clean:
                 'E_DEF_RATING_away', 'DEF_RATING_away', 'E_NET_RATING_away', 
                 'NET_RATING_away', 'POSS_away', 'PIE_away', 'PTS_2PT_MR_away', 'PTS_FB_away',
                 'PTS_OFF_TOV_away', 'PTS_PAINT_away', 'AST_2PM_away', 'AST_3PM_away', 
-                'UAST_2PM_away', 'UAST_3PM_away']]
-
-        return pd.DataFrame(boxscores_clean)
-
-    def players(self):
-
-        self.cur.execute("SELECT * FROM player_game_logs")
-        rows3 = self.cur.fetchall()
+                'UAST_2PM_away', 'UAST_3PM_away']
 
-        db_scoring_list = []
+        return self.query("SELECT {} FROM boxscore".format(', '.join(columns)), types=column_types('boxscore'))
 
-        for row in rows3:
-            db_scoring_list.append(row)
+    def _players_sql(self, seasons=None, team_ids=None, player_ids=None, skip_ranks=False):
+        columns = ['CAST({0} AS TEXT) AS {0}'.format(col) if col in PLAYER_ID_COLUMNS else col
+                   for col in column_names('player_game_logs')
+                   if not (skip_ranks and col in RANK_COLUMNS)]
 
-        player_index = pd.DataFrame(data=db_scoring_list)
+        where, params = [], []
+        for col, values in [('SEASON_YEAR', seasons), ('TEAM_ID', team_ids), ('PLAYER_ID', player_ids)]:
+            if values is not None:
+                where.append('{} IN ({})'.format(col, ', '.join(['?'] * len(values))))
+                params.extend(value if col == 'SEASON_YEAR' else int(value) for value in values)
 
-        player_index.columns = ["SEASON_YEAR","PLAYER_ID","PLAYER_NAME","NICKNAME",
-                    "TEAM_ID","TEAM_ABBREVIATION","TEAM_NAME","GAME_ID","GAME_DATE","MATCHUP","WL","MIN","FGM","FGA",
-                    "FG_PCT","FG3M","FG3A","FG3_PCT","FTM","FTA","FT_PCT","OREB","DREB","REB","AST",
-                    "TOV","STL","BLK","BLKA","PF","PFD","PTS","PLUS_MINUS","NBA_FANTASY_PTS","DD2",
-                    "TD3","GP_RANK","W_RANK","L_RANK","W_PCT_RANK","MIN_RANK","FGM_RANK","FGA_RANK",
-                    "FG_PCT_RANK","FG3M_RANK","FG3A_RANK","FG3_PCT_RANK","FTM_RANK","FTA_RANK","FT_PCT_RANK",
-                    "OREB_RANK","DREB_RANK","REB_RANK","AST_RANK","TOV_RANK","STL_RANK","BLK_RANK",
-                    "BLKA_RANK","PF_RANK","PFD_RANK","PTS_RANK","PLUS_MINUS_RANK","NBA_FANTASY_PTS_RANK",
-                    "DD2_RANK","TD3_RANK",'WNBA_FANTASY_PTS','WNBA_FANTASY_PTS_RANK','AVAILABLE_FLAG']
+        sql = 'SELECT {} FROM player_game_logs'.format(', '.join(columns))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return sql, params
 
-        player_index['TEAM_ID'] = player_index['TEAM_ID'].astype(str, copy=True)
-        player_index['GAME_ID'] = player_index['GAME_ID'].astype(str, copy=True)
-        player_index['PLAYER_ID'] = player_index['PLAYER_ID'].astype(str, copy=True)
+    def iter_players(self, chunksize=50000, seasons=None, team_ids=None, player_ids=None, skip_ranks=False):
+        """Streams player_game_logs as typed chunks of at most chunksize rows.
 
-        return pd.DataFrame(player_index)
+        seasons ('2023-24'), team_ids and player_ids filter the rows in SQL,
+        through the indexes on those columns. TEAM_ID, GAME_ID and PLAYER_ID
+        come back as strings, the other columns are cast with PLAYER_DTYPES.
+        """
+        sql, params = self._players_sql(seasons, team_ids, player_ids, skip_ranks)
+        for chunk in self.iter_query(sql, params, chunksize, PLAYER_TYPES):
+            yield apply_dtypes(chunk, PLAYER_DTYPES)
+
+    def players(self, seasons=None, team_ids=None, player_ids=None, skip_ranks=False):
+        """Every player game matching the filters of iter_players as one DataFrame"""
+        sql, params = self._players_sql(seasons, team_ids, player_ids, skip_ranks)
+        return apply_dtypes(self.query(sql, params, types=PLAYER_TYPES), PLAYER_DTYPES)
     
     def agg_boxscores_raw(self):
-        self.cur.execute("SELECT * FROM team_basic_boxscores as bb JOIN team_advanced_boxscores as ab on bb.GAME_ID = ab.GAME_ID AND bb.TEAM_ID = ab.TEAM_ID JOIN team_scoring_boxscores as sb ON bb.GAME_ID = sb.GAME_ID and bb.TEAM_ID = sb.TEAM_ID")
-        rows3 = self.cur.fetchall()
-
-        db_scoring_list = []
-
-        for row in rows3:
-            db_scoring_list.append(row)
-
-        player_index = pd.DataFrame(data=db_scoring_list)
-
-        player_index.columns = ['SEASON', 'TEAM_ID', 'TEAM_ABBREVIATION', 
-                    'TEAM_NAME', 'GAME_ID', 'GAME_DATE', 'MATCHUP', 'WL', 'MIN', 'FGM', 'FGA', 
-                    'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT', 'OREB',
-                    'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 
-                    'PTS_DIFF', 'GAME_ID_drop', 'TEAM_ID_drop', 'TEAM_NAME_drop', 
-                    'TEAM_ABBREVIATION_drop', 'TEAM_CITY_drop', 'MIN_drop', 'E_OFF_RATING', 'OFF_RATING', 'E_DEF_RATING', 
-                    'DEF_RATING', 'E_NET_RATING', 'NET_RATING', 'AST_PCT', 'AST_TOV', 
-                    'AST_RATIO', 'OREB_PCT', 'DREB_PCT', 'REB_PCT', 'E_TM_TOV_PCT', 
-                    'TM_TOV_PCT', 'EFG_PCT', 'TS_PCT', 'USG_PCT', 'E_USG_PCT', 'E_PACE', 
-                    'PACE', 'PACE_PER40', 'POSS', 'PIE', 'GAME_ID_drop', 'TEAM_ID_drop', 'TEAM_NAME_drop', 'TEAM_ABBREVIATION_drop', 'TEAM_CITY_drop',
-                    'MIN_drop', 'PCT_FGA_2PT', 'PCT_FGA_3PT', 'PCT_PTS_2PT', 'PCT_PTS_2PT_MR',
-                    'PCT_PTS_3PT', 'PCT_PTS_FB', 'PCT_PTS_FT', 'PCT_PTS_OFF_TOV',
-                    'PCT_PTS_PAINT', 'PCT_AST_2PM', 'PCT_UAST_2PM', 'PCT_AST_3PM',
-                    'PCT_UAST_3PM', 'PCT_AST_FGM', 'PCT_UAST_FGM']
-        
-        remove_column_lst = ['TEAM_ABBREVIATION_drop','TEAM_ID_drop', 'TEAM_CITY_drop', 'TEAM_NAME_drop', 'GAME_ID_drop', 'MIN_drop']
-
-        tdf1 = player_index[player_index.columns[~player_index.columns.isin(remove_column_lst)]]
-        
-        return tdf1
\ No newline at end of file
+        """Basic, advanced and scoring boxscores joined on GAME_ID and TEAM_ID,
+        with PLUS_MINUS named PTS_DIFF and the join's duplicate columns left out"""
+        basic = ['bb.{}'.format(col) if col != 'PLUS_MINUS' else 'bb.PLUS_MINUS AS PTS_DIFF'
+                 for col in column_names('team_basic_boxscores')]
+        advanced = ['ab.{}'.format(col) for col in column_names('team_advanced_boxscores')[6:]]
+        scoring = ['sb.{}'.format(col) for col in column_names('team_scoring_boxscores')[6:]]
+        types = {**column_types('team_scoring_boxscores'), **column_types('team_advanced_boxscores'),
+                 **column_types('team_basic_boxscores'), 'PTS_DIFF': 'INTEGER'}
+
+        return self.query("SELECT {} FROM team_basic_boxscores as bb JOIN team_advanced_boxscores as ab on bb.GAME_ID = ab.GAME_ID AND bb.TEAM_ID = ab.TEAM_ID JOIN team_scoring_boxscores as sb ON bb.GAME_ID = sb.GAME_ID and bb.TEAM_ID = sb.TEAM_ID".format(
+            ', '.join(basic + advanced + scoring)), types=types)
@@ -0,0 +1,162 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# pandas is imported in partition, the only function that needs the module,
+# so model and predict (through feature_store and team_form) don't load it
+
+# Identifier columns of the convert_pcts output that never go into a window
+ID_COLUMNS = ['SEASON', 'TEAM_ID', 'TEAM_NAME', 'GAME_ID', 'GAME_DATE', 'MATCHUP']
+
+
+def feature_columns(df, label='WL', drop=ID_COLUMNS):
+    """Every column except the label and the id columns, sorted by name
+    (the order the notebooks get from data.columns.difference)"""
+    return [col for col in df.columns.difference(drop) if col != label]
+
+
+def count_windows(group_sizes, window_size):
+    return int(sum(max(size - window_size, 0) for size in group_sizes))
+
+
+def partition(df, group='TEAM_ABBREVIATION'):
+    """Sorts the rows by group once, keeping each team's rows in frame order.
+    Returns the row order and offsets: team i is order[offsets[i]:offsets[i+1]].
+    Teams come in the order groupby(group, sort=True) gives them."""
+    import pandas as pd
+
+    codes, uniques = pd.factorize(df[group], sort=True)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return order, offsets
+
+
+def window_offsets(offsets, window_size):
+    """Position of each team's first window in the output"""
+    return np.concatenate([[0], np.cumsum(np.maximum(np.diff(offsets) - window_size, 0))])
+
+
+def _fill_windows(values, labels, offsets, starts, window_size, X, y, teams):
+    """Writes the windows of the given teams of the sorted values into X and y"""
+    for team in teams:
+        lo, hi, pos = offsets[team], offsets[team + 1], starts[team]
+        n = hi - lo - window_size
+        if n <= 0:
+            continue
+        # (n, F, window_size) view over the team's rows, swapped to (n, window_size, F)
+        X[pos:pos + n] = sliding_window_view(values[lo:hi], window_size, axis=0)[:n].transpose(0, 2, 1)
+        y[pos:pos + n] = labels[lo + window_size:hi]
+
+
+def _fill_shared(job):
+    """Worker side of make_windows: attaches the shared arrays and fills its teams.
+    job['arrays'] maps values, labels, y and X to (shared memory name, shape),
+    except that X is the path of a .npy memmap when job['X_path'] is set."""
+    handles, arrays = [], {}
+    try:
+        for key, (name, shape) in job['arrays'].items():
+            shm = shared_memory.SharedMemory(name=name)
+            handles.append(shm)
+            arrays[key] = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        if job['X_path']:
+            arrays['X'] = np.load(job['X_path'], mmap_mode='r+')
+
+        _fill_windows(arrays['values'], arrays['labels'], job['offsets'], job['starts'], job['window_size'],
+                      arrays['X'], arrays['y'], job['teams'])
+        if job['X_path']:
+            arrays['X'].flush()
+    finally:
+        # The views have to go before their shared memory can be closed
+        arrays.clear()
+        for shm in handles:
+            shm.close()
+
+
+def _shared(shape, like=None):
+    """Shared float32 block of the given shape, with a copy of like in it"""
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 4, 1))
+    if like is not None:
+        np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[:] = like
+    return shm
+
+
+def make_windows(df, window_size, features=None, label='WL', group='TEAM_ABBREVIATION', out=None, out_path=None,
+                 workers=1):
+    """Turns the per-team rows of the convert_pcts output into LSTM training windows.
+
+    For each team (in sorted order of `group`, rows kept in frame order),
+    window i holds the features of games i .. i+window_size-1 and its label
+    is `label` of game i+window_size. The rows are sorted by team once and
+    each team's windows are copied out of a strided view of its contiguous
+    block, with no per-element Python work.
+
+    Every feature column has to be numeric, so encode TEAM_ABBREVIATION first.
+    `out` can be a preallocated float32 array of shape (N, window_size, F);
+    with `out_path` the windows are written to a new .npy memmap instead.
+
+    With workers > 1 the teams are split across a process pool. The sorted
+    features are placed in shared memory once, and the workers write their
+    teams' windows straight into a shared output (or into the out_path
+    memmap), so nothing is pickled per team. Without out_path the shared
+    output is copied into the returned array once at the end.
+
+    Returns X with shape (N, window_size, F) and y with shape (N,), both float32.
+    """
+    features = features or feature_columns(df, label)
+    order, offsets = partition(df, group)
+    starts = window_offsets(offsets, window_size)
+    shape = (int(starts[-1]), window_size, len(features))
+
+    if out is None and out_path is not None:
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=shape)
+    elif out is None and workers <= 1:
+        out = np.empty(shape, dtype=np.float32)
+    elif out is not None and out.shape != shape:
+        raise ValueError('out has shape {}, expected {}'.format(out.shape, shape))
+
+    values = df[features].to_numpy(dtype=np.float32)[order]
+    labels = df[label].to_numpy(dtype=np.float32)[order]
+    n_teams = len(offsets) - 1
+
+    if workers <= 1:
+        y = np.empty(shape[0], dtype=np.float32)
+        _fill_windows(values, labels, offsets, starts, window_size, out, y, range(n_teams))
+        return out, y
+
+    shapes = {'values': values.shape, 'labels': labels.shape, 'y': (shape[0],)}
+    shared = {'values': _shared(values.shape, values), 'labels': _shared(labels.shape, labels),
+              'y': _shared(shapes['y'])}
+    if out_path is None:
+        shapes['X'] = shape
+        shared['X'] = _shared(shape)
+    else:
+        out.flush()
+
+    try:
+        arrays = {key: (shm.name, shapes[key]) for key, shm in shared.items()}
+        # Deal teams round robin so every worker gets a similar number of rows
+        jobs = [{'arrays': arrays, 'X_path': out_path, 'offsets': offsets, 'starts': starts,
+                 'window_size': window_size, 'teams': list(range(i, n_teams, workers))}
+                for i in range(min(workers, n_teams))]
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            list(pool.map(_fill_shared, jobs))
+
+        y = np.ndarray(shape[0], dtype=np.float32, buffer=shared['y'].buf).copy()
+        if out_path is not None:
+            X = out
+        else:
+            view = np.ndarray(shape, dtype=np.float32, buffer=shared['X'].buf)
+            if out is None:
+                X = view.copy()
+            else:
+                X = out
+                X[:] = view
+            del view
+    finally:
+        for shm in shared.values():
+            shm.close()
+            shm.unlink()
+
+    return X, y